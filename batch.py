@@ -0,0 +1,124 @@
+# batch.py - memory bounded rendering of many pages.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gc
+import sys
+import resource
+
+
+class Rss():
+    # resident set size of this process in kB, read from /proc where available.
+    status_path = '/proc/self/status'
+    clear_refs_path = '/proc/self/clear_refs'
+
+    def __init__(self):
+        self.resettable = False
+        return
+
+    def reset_peak(self):
+        # writing 5 to clear_refs resets the VmHWM high water mark (linux only).
+        try:
+            with open(self.clear_refs_path, 'w') as fp:
+                fp.write('5')
+            self.resettable = True
+        except OSError:
+            self.resettable = False
+
+        return
+
+    def status(self, key):
+        try:
+            with open(self.status_path, 'r') as fp:
+                for line in fp:
+                    if line.startswith(key + ':'):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+
+        return None
+
+    @property
+    def peak(self):
+        # highest rss since reset_peak(), None where the high water mark can not be reset
+        if not self.resettable:
+            return None
+
+        return self.status('VmHWM')
+
+    @property
+    def process_peak(self):
+        # highest rss over the life of the process
+        peak = self.status('VmHWM')
+        if peak is None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform == 'darwin':
+                # bytes on macos, kB elsewhere
+                peak = peak // 1024
+
+        return peak
+
+    @property
+    def current(self):
+        return self.status('VmRSS')
+
+
+def render_batch(pages, exporter, report):
+    """
+    Render and save every page, tearing each one down as soon as it is saved.
+
+    Args:
+        pages (Pages): the pages to render
+        exporter (Exporter): export targets for each saved page
+        report (StatsReport): counter report, printed per page
+
+    Returns:
+        peaks (list): (filepath, peak rss kB) for each page, None where the peak can
+            not be measured per page
+    """
+    rss = Rss()
+    peaks = []
+
+    rss.reset_peak()
+    for page in pages:
+        filepath = page.save()
+        exporter.submit(filepath, page.as_svg())
+
+        page.release()
+        del page
+        gc.collect()
+
+        peak = rss.peak
+        peaks.append((filepath, peak))
+
+        if peak is None:
+            # only the process wide peak is known, an upper bound for every page
+            memory = 'process peak rss {:.1f} MB'.format(rss.process_peak / 1024)
+        else:
+            memory = 'peak rss {:.1f} MB'.format(peak / 1024)
+
+        current = rss.current
+        if current is not None:
+            memory += '  current rss {:.1f} MB'.format(current / 1024)
+
+        print('Saved to {}  {}'.format(filepath, memory))
+        report.page(filepath)
+
+        rss.reset_peak()
+
+    gc.collect()
+
+    return peaks
@@ -0,0 +1,142 @@
+# checks.py - Application. checks behavior that the rendered fixtures do not pin down.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# python checks.py     run every check, exit status 1 on any failure
+#
+# each check returns a list of failure descriptions, empty when it holds.
+
+import threading
+
+from config import LayeredConfig
+from notes import Footnotes
+
+
+def expect(failures, what, actual, expected):
+    if actual != expected:
+        failures.append('{}: got {!r}, expected {!r}'.format(what, actual, expected))
+
+    return
+
+
+def check_config():
+    """
+    Merge rules of LayeredConfig: notes, footnotes, nested sections and plain keys.
+
+    Returns:
+        failures (list): description of each failed check
+    """
+    failures = []
+
+    family = dict(
+        width=2000,
+        notes=[['$legend'], ['family note'], ['$footnotes']],
+        footnotes=[dict(type='constant', key='', text='family')],
+        header=dict(title='Family', subtitle='all variants'),
+        label_width=dict(mode='column', quantum=10),
+    )
+    variant = dict(
+        width=1500,
+        notes=['', ['variant note'], '', ['extra note']],
+        footnotes=[dict(type='function', key='USART0', text='variant')],
+        header=dict(title='Variant'),
+        label_width='text',
+    )
+    config = LayeredConfig(dict(width=1000, height=1000), family, variant)
+
+    expect(failures, 'last layer wins', config['width'], 1500)
+    expect(failures, 'lower layer fills in', config['height'], 1000)
+    expect(failures, 'empty note keeps the page note', config['notes'][0], ['$legend'])
+    expect(failures, 'note replaces the page note', config['notes'][1], ['variant note'])
+    expect(failures, 'note beyond the page notes is added', config['notes'][3], ['extra note'])
+    expect(failures, 'footnotes concatenate, family first',
+           [footnote['text'] for footnote in config['footnotes']], ['family', 'variant'])
+    expect(failures, 'nested section layers key by key', dict(config['header']),
+           dict(title='Variant', subtitle='all variants'))
+    expect(failures, 'plain value replaces a section', config['label_width'], 'text')
+    expect(failures, 'absent layers are skipped', dict(LayeredConfig(None, dict(a=1), None)), dict(a=1))
+
+    if 'missing' in config:
+        failures.append('missing key: found in the config')
+
+    expect(failures, 'layers are left unchanged', family['notes'], [['$legend'], ['family note'], ['$footnotes']])
+
+    return failures
+
+
+def check_footnotes():
+    """
+    Footnote ids are allocated per page in order of first use, also while other pages
+    number theirs in other threads.
+
+    Returns:
+        failures (list): description of each failed check
+    """
+    failures = []
+
+    config = [
+        dict(type='constant', key='', text='label format'),
+        dict(type='function', key='USART0', text='usart'),
+        dict(type='group', key='TWI', text='twi'),
+    ]
+
+    # footnotes referenced by each page, in order.  every step waits for all pages.
+    orders = [[2, 1, 2], [1, 2, 1], [2, 2, 2], [1, 1, 2]]
+    expected = [
+        ['1. label format', '2. twi', '3. usart'],
+        ['1. label format', '2. usart', '3. twi'],
+        ['1. label format', '2. twi'],
+        ['1. label format', '2. usart', '3. twi'],
+    ]
+
+    pages = [Footnotes(config) for order in orders]
+    barrier = threading.Barrier(len(pages), timeout=10)
+
+    def number(footnotes, order):
+        for index in order:
+            barrier.wait()
+            footnotes.footnotes[index].id
+
+        return
+
+    threads = [threading.Thread(target=number, args=(footnotes, order)) for footnotes, order in zip(pages, orders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i, footnotes in enumerate(pages):
+        expect(failures, 'page {} footnotes'.format(i), footnotes.strings, expected[i])
+
+    return failures
+
+
+checks = dict(config=check_config, footnotes=check_footnotes)
+
+
+if __name__ == '__main__':
+    failed = 0
+    for name, check in checks.items():
+        failures = check()
+        print('{:9} {}'.format(name, 'FAIL' if failures else 'ok'))
+        for failure in failures:
+            print('    {}'.format(failure))
+
+        if failures:
+            failed += 1
+
+    print('{} failed'.format(failed))
+    exit(1 if failed else 0)
@@ -0,0 +1,197 @@
+# compact.py - compact pinmap representation for holding many devices in memory at once.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+
+from dx_functions import match_footnotes
+from signals import SignalRecord, intern
+from pinout import DxPinmap
+
+
+class PadRecord():
+    # a pinout mapping entry. duck types the atdf pinout mapping for DxPinmap.
+    __slots__ = ('position', 'pad')
+
+    def __init__(self, position, pad):
+        self.position = int(position)
+        self.pad = intern(pad)
+        return
+
+
+class CompactPinmap():
+    """
+    Array backed pinmap.
+
+    Signals are SignalRecords in a flat list, pooled ones shared with the other
+    devices of the family.  The records of the pad at pads[i] are
+    records[offsets[i]:offsets[i+1]].  Footnote ids are only kept for the few
+    records that have them.  Use to_pinmap() for a full DxPinmap view
+    that Overview.Pinout and Overview.Legend can consume.
+    """
+    def __init__(self, name=''):
+        self.name = intern(name)
+
+        self.pads = []
+        self.records = []
+        self.offsets = array('I', [0])
+        self.footnotes = dict()
+
+        return
+
+    @classmethod
+    def from_atdf(cls, atdf, footnotes=None, pool=None):
+        """
+        Build a compact pinmap of the first variant of an atdf.
+
+        Args:
+            atdf: microchip_dfp Atdf
+            footnotes (Footnotes): footnotes to match against the signals, or None
+            pool (SignalPool): family pool to share signal records with, or None
+
+        Returns:
+            CompactPinmap
+        """
+        variant = atdf.variants[0]
+        device = atdf.devices[0]
+
+        pinmap = cls(device.name)
+        pad_signals = dict()
+        for mapping in atdf.pinouts[variant.pinout]:
+            pad_signals[mapping.pad] = (PadRecord(mapping.position, mapping.pad), [])
+
+        for module in device.peripherals:
+            for name, instance in module.instances.items():
+                if not instance.signals:
+                    continue
+
+                for signal in instance.signals:
+                    pad_signals[signal.pad][1].append(signal)
+
+        for pad, signals in sorted(pad_signals.values(), key=lambda item: item[0].position):
+            pinmap.append_pad(pad, signals, footnotes, pool)
+
+        return pinmap
+
+    @classmethod
+    def from_pinmap(cls, dx_pinmap, name='', pool=None):
+        """
+        Compact an existing DxPinmap.
+
+        Args:
+            dx_pinmap (DxPinmap): a built pinmap
+            name (str): device name
+            pool (SignalPool): family pool to share signal records with, or None
+
+        Returns:
+            CompactPinmap
+        """
+        pinmap = cls(name)
+        for pad_name, position in sorted(dx_pinmap.reverse_map.items(), key=lambda item: item[1]):
+            functions = dx_pinmap.functions[position]
+
+            start = len(pinmap.records)
+            pinmap.append_pad(PadRecord(position, pad_name), [function.signal for function in functions], pool=pool)
+
+            for offset, function in enumerate(functions):
+                if function.footnotes:
+                    pinmap.footnotes[start + offset] = tuple(function.footnotes)
+
+        return pinmap
+
+    def append_pad(self, pad, signals, footnotes=None, pool=None):
+        """
+        Args:
+            pad (PadRecord): the pad to append
+            signals (list): atdf signals on the pad
+            footnotes (Footnotes): footnotes to match against the signals, or None
+            pool (SignalPool): family pool to share signal records with, or None
+        """
+        self.pads.append(pad)
+
+        for signal in signals:
+            index = len(self.records)
+            if pool is None:
+                self.records.append(SignalRecord(signal))
+            else:
+                self.records.append(pool.record(signal))
+
+            if footnotes is not None:
+                ids = match_footnotes(signal, footnotes)
+                if ids:
+                    self.footnotes[index] = tuple(ids)
+
+        self.offsets.append(len(self.records))
+        return
+
+    def __len__(self):
+        return len(self.pads)
+
+    def __iter__(self):
+        for i, pad in enumerate(self.pads):
+            yield pad, self.pad_records(i)
+
+        return
+
+    def pad_records(self, i):
+        start = self.offsets[i]
+        end = self.offsets[i+1]
+
+        return self.records[start:end]
+
+    def pad_signals(self, i):
+        """
+        Returns:
+            signals (frozenset): the (function, group, index) of every signal on pad i
+        """
+        return frozenset((record.function, record.group, record.index) for record in self.pad_records(i))
+
+    def signatures(self):
+        """
+        Per pad signature hashes.  Two pads with the same signature carry the same signals.
+
+        Returns:
+            signatures (dict): pad name -> hash of the pad's signals
+        """
+        signatures = dict()
+        for i, pad in enumerate(self.pads):
+            signatures[pad.pad] = hash(self.pad_signals(i))
+
+        return signatures
+
+    def to_pinmap(self):
+        """
+        Expand to a sorted DxPinmap with full function labels.
+
+        Returns:
+            DxPinmap
+        """
+        pinmap = DxPinmap(self.pads)
+
+        for i, pad in enumerate(self.pads):
+            start = self.offsets[i]
+            end = self.offsets[i+1]
+
+            for index in range(start, end):
+                record = self.records[index]
+                function = record.cls(signal=record)
+                function._footnotes.extend(self.footnotes.get(index, ()))
+
+                pinmap.append_function(pad.pad, function)
+
+        pinmap.sort()
+
+        return pinmap
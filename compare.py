@@ -0,0 +1,162 @@
+# compare.py - Application. reports pin by pin signal differences between devices or DFP releases.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import argparse
+
+import microchip_dfp as Dfpack
+
+from compact import CompactPinmap
+from signals import SignalPool
+
+
+class PinmapDiff():
+    def __init__(self, old, new):
+        """
+        Signal differences between two compact pinmaps.
+
+        Pads are matched by name.  Only pads whose signature hashes differ are
+        examined signal by signal.
+
+        Args:
+            old (CompactPinmap): the reference pinmap
+            new (CompactPinmap): the pinmap to compare against the reference
+        """
+        self.old = old
+        self.new = new
+
+        self.added = []    # (pad, text)
+        self.removed = []  # (pad, text)
+        self.moved = []    # (text, old pads, new pads)
+
+        self.compare()
+        return
+
+    @property
+    def is_same(self):
+        return not (self.added or self.removed or self.moved)
+
+    def compare(self):
+        old_signatures = self.old.signatures()
+        new_signatures = self.new.signatures()
+
+        if old_signatures == new_signatures:
+            return
+
+        removed = dict()  # signal -> [pad, ...]
+        added = dict()
+        texts = dict()
+
+        old_pads = {pad.pad: i for i, pad in enumerate(self.old.pads)}
+        new_pads = {pad.pad: i for i, pad in enumerate(self.new.pads)}
+
+        for pad_name in sorted(set(old_signatures) | set(new_signatures)):
+            if old_signatures.get(pad_name) == new_signatures.get(pad_name):
+                continue
+
+            old_signals = self.pad_signals(self.old, old_pads.get(pad_name), texts)
+            new_signals = self.pad_signals(self.new, new_pads.get(pad_name), texts)
+
+            for signal in old_signals - new_signals:
+                removed.setdefault(signal, []).append(pad_name)
+
+            for signal in new_signals - old_signals:
+                added.setdefault(signal, []).append(pad_name)
+
+        for signal in sorted(set(removed) | set(added)):
+            text = texts[signal]
+            if signal in removed and signal in added:
+                self.moved.append((text, removed[signal], added[signal]))
+            elif signal in removed:
+                self.removed.extend((pad, text) for pad in removed[signal])
+            else:
+                self.added.extend((pad, text) for pad in added[signal])
+
+        return
+
+    def pad_signals(self, pinmap, i, texts):
+        if i is None:
+            return frozenset()
+
+        signals = set()
+        for record in pinmap.pad_records(i):
+            signal = (record.function, record.group, record.index)
+            texts[signal] = record.text
+            signals.add(signal)
+
+        return frozenset(signals)
+
+    def report(self):
+        lines = ['{} -> {}'.format(self.old.name, self.new.name)]
+
+        if self.is_same:
+            lines.append('  identical')
+
+        for pad, text in self.added:
+            lines.append('  + {:6} {}'.format(pad, text))
+
+        for pad, text in self.removed:
+            lines.append('  - {:6} {}'.format(pad, text))
+
+        for text, old_pads, new_pads in self.moved:
+            lines.append('  ~ {} {} -> {}'.format(text, ','.join(old_pads), ','.join(new_pads)))
+
+        return '\n'.join(lines)
+
+
+def atdf_pairs(old_path, new_path):
+    """
+    Pair up atdf files.  Two directories (two DFP releases) are paired by file name.
+
+    Returns:
+        pairs (list): (old atdf path, new atdf path)
+    """
+    old_path = os.path.expanduser(old_path)
+    new_path = os.path.expanduser(new_path)
+
+    if os.path.isdir(old_path) and os.path.isdir(new_path):
+        old_names = set(name for name in os.listdir(old_path) if name.endswith('.atdf'))
+        new_names = set(name for name in os.listdir(new_path) if name.endswith('.atdf'))
+
+        for name in sorted(old_names ^ new_names):
+            print('{} only in one release'.format(name))
+
+        return [(os.path.join(old_path, name), os.path.join(new_path, name)) for name in sorted(old_names & new_names)]
+
+    return [(old_path, new_path)]
+
+
+def load_pinmap(path, pinmaps, pool):
+    if path not in pinmaps:
+        pinmaps[path] = CompactPinmap.from_atdf(Dfpack.Atdf(path), pool=pool)
+
+    return pinmaps[path]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the pinmaps of two devices or two DFP atdf directories.')
+    parser.add_argument('old', help='reference atdf file or atdf directory')
+    parser.add_argument('new', help='atdf file or atdf directory to compare against the reference')
+    args = parser.parse_args()
+
+    pool = SignalPool()
+    pinmaps = dict()
+    for old_path, new_path in atdf_pairs(args.old, args.new):
+        diff = PinmapDiff(load_pinmap(old_path, pinmaps, pool), load_pinmap(new_path, pinmaps, pool))
+        print(diff.report())
+
+    exit()
@@ -0,0 +1,92 @@
+# config.py - layered page configuration.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# a page reads its settings through a LayeredConfig of
+#     page_defaults -> the family's 'page' section -> the variant section
+# keys resolve when read, so a variant costs only its own overrides.  the layers
+# are never copied or written, so one family config serves every page, thread
+# and worker at once.
+
+from collections.abc import Mapping
+
+
+page_defaults = dict(
+    width=1000,
+    height=1000,
+)
+
+
+def merge_notes(layers):
+    # a later layer's note replaces the one at the same position unless it is empty
+    notes = []
+    for layer in layers:
+        for i, note in enumerate(layer):
+            if i == len(notes):
+                notes.append(note)
+            elif len(note) > 0:
+                notes[i] = note
+
+    return notes
+
+
+def merge_footnotes(layers):
+    # footnotes of every layer, family wide ones first
+    footnotes = []
+    for layer in layers:
+        footnotes.extend(layer)
+
+    return footnotes
+
+
+class LayeredConfig(Mapping):
+    # keys with a rule merge the values of every layer, other dict values are layered
+    # themselves and anything else is taken from the last layer that has the key.
+    rules = dict(notes=merge_notes, footnotes=merge_footnotes)
+
+    def __init__(self, *layers):
+        """
+        Args:
+            layers (dict): lowest precedence first, None for an absent layer
+        """
+        self.layers = tuple(layer for layer in layers if layer is not None)
+        return
+
+    def __getitem__(self, key):
+        values = [layer[key] for layer in self.layers if key in layer]
+        if not values:
+            raise KeyError(key)
+
+        if key in self.rules:
+            return self.rules[key](values)
+
+        if isinstance(values[-1], Mapping):
+            return LayeredConfig(*[value for value in values if isinstance(value, Mapping)])
+
+        return values[-1]
+
+    def __iter__(self):
+        keys = dict()
+        for layer in self.layers:
+            keys.update(dict.fromkeys(layer))
+
+        return iter(keys)
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return 'LayeredConfig({})'.format(dict(self))
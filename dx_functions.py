@@ -2,58 +2,91 @@
 # pip install v-palette
 # for palette colors selection, view  https://github.com/villoro/vpalette
 
+import functools
+
 from pinoutOverview import FunctionLabel, Functions
-from v_palette import get_colors
+import v_palette
+
+import stats
 
 palette = 'flat'
 
 
+@functools.lru_cache(maxsize=None)
+def resolve_colors(color, palette):
+    # resolved once per process and shared by every label, page and family
+    return v_palette.get_colors(color, palette=palette)
+
+
+def get_colors(color, palette):
+    # counts every lookup, cached or not, as it did before colors were cached
+    if stats.enabled:
+        stats.count('get_colors')
+
+    return resolve_colors(color, palette)
+
+
 class SignalFunctionFactory():
     def __new__(cls, signal):
+        function_class = cls.classify(signal.function)
+        return function_class(signal=signal)
+
+    @classmethod
+    def classify(cls, function):
+        """
+        Map an atdf signal function name to its DxSignalFunction class
+        without building the function label.
+
+        Args:
+            function (str): atdf signal function such as 'TCA0' or 'USART1_ALT1'
+
+        Returns:
+            the DxSignalFunction subclass that represents the function
+        """
         # get function type and peripheral index
-        ftype, partition, suffix = signal.function.partition('_')
+        ftype, partition, suffix = function.partition('_')
         ftype = ftype.rstrip('0123456789').lower()
 
         if ftype in ['tca','tcb','tcd']:
-            return PwmSignalFunction(signal=signal)
+            return PwmSignalFunction
 
         if ftype in['tca']:
-            return TcaSignalFunction(signal=signal)
+            return TcaSignalFunction
 
         if ftype in['tcb']:
-            return TcbSignalFunction(signal=signal)
+            return TcbSignalFunction
 
         if ftype in['tcd']:
-            return TcdSignalFunction(signal=signal)
+            return TcdSignalFunction
         
         if ftype in['ptc']:
-            return PtcSignalFunction(signal=signal)
+            return PtcSignalFunction
         
         if ftype in ['ain', 'dac', 'vrefa']:
-            return AnalogSignalFunction(signal=signal)
+            return AnalogSignalFunction
 
         if ftype in['opamp']:
-            return OpampSignalFunction(signal=signal)
+            return OpampSignalFunction
 
         if ftype in ['ac', 'zcd']:
-            return ComparatorSignalFunction(signal=signal)
+            return ComparatorSignalFunction
 
         if ftype in ['usart']:
-            return AsyncSerialSignalFunction(signal=signal)
+            return AsyncSerialSignalFunction
                     
         if ftype in ['twi', 'spi', 'i2c']:
-            return SyncSerialSignalFunction(signal=signal)
+            return SyncSerialSignalFunction
                     
         if ftype in ['ccl', 'evsys']:
-            return LogicSignalFunction(signal=signal)
+            return LogicSignalFunction
             
         if ftype in ['clkctrl', 'other', 'updi']:
-            return SystemSignalFunction(signal=signal)
+            return SystemSignalFunction
 
         if ftype in ['ioport']:
-            return SkipSignalFunction(signal=signal)
+            return SkipSignalFunction
 
-        return OtherSignalFunction(signal=signal)
+        return OtherSignalFunction
     
 class PinFunctionFactory():
     def __new__(cls, pin_name):
@@ -81,24 +114,82 @@ class PinFunctionFactory():
         return OtherPinFunction(pin_name)
 
 
+def match_footnotes(signal, footnotes):
+    """
+    Find the footnotes that apply to an atdf signal.
+
+    Args:
+        signal: atdf signal (or SignalRecord) with function and group attributes
+        footnotes (list): A list of all possible footnotes
+
+    Returns:
+        ids (list): the ids of the matching footnotes
+    """
+    ids = []
+    for footnote in footnotes:
+        if stats.enabled:
+            stats.count('footnote_tests')
+
+        if footnote.type.lower() == 'function' and footnote.key in signal.function:
+            ids.append(footnote.id)
+            print('  Function footnote found', signal.function)
+        if footnote.type.lower() == 'group' and footnote.key in signal.group:
+            ids.append(footnote.id)
+            print('  Group footnote found', signal.group)
+
+    return ids
+
+
 sort_index = 0
 class DxFunction(FunctionLabel):
     # DxFunction parses the atpack signal to properties that
     # the Function base class can make use of.
     type_index = sort_index
 
+    # order of labels of the same type on a pad. any of 'instance' and 'alt',
+    # e.g. ('alt', 'instance') to list alternate positions last.
+    sort_fields = ('instance', 'alt')
+
     def __init__(self):
         super().__init__()
         self._footnotes = []
+        self._text = None
+        self.sort_key = None
         return
 
     @property
     def text(self):
+        # the label text, built by make_text() on first use and kept until invalidated
+        if self._text is None:
+            self._text = self.make_text()
+
+        return self._text
+
+    def invalidate(self):
+        # forget the cached text. called whenever an input of make_text() changes
+        self._text = None
+        return
+
+    def seed_text(self, text):
+        # take the text already made for an identical signal, such as a pooled record's
+        self._text = text
+        return
+
+    def pack_sort_key(self):
+        # called once the function is parsed. DxPinmap.sort() orders pads by the packed key.
+        values = dict(instance=self.instance, alt=self.alt_position)
+        self.sort_key = (self.type_index,) + tuple(values[field] for field in self.sort_fields)
+        return
+
+    def make_text(self):
         # the text to be displayed inside a function label
         # typically overridden by the function specialization
         return self.name
 
     def parse_function(self, function):
+        if stats.enabled:
+            stats.count('parse_function')
+
         inst_name, partition, alt_pos = function.partition('_ALT')
 
         name = inst_name.rstrip('0123456789')
@@ -130,12 +221,47 @@ class DxSignalFunction(DxFunction):
         super().__init__()
 
         self.signal = signal
-        self.raw_value = self.signal.function
-
         self.width = 70
 
         return
 
+    @property
+    def signal(self):
+        return self._signal
+
+    @signal.setter
+    def signal(self, signal):
+        self._signal = signal
+
+        # a pooled SignalRecord carries what its first label parsed, so each distinct
+        # signal is parsed once per family rather than once per page
+        parsed = getattr(signal, 'parsed', None)
+        if parsed is None:
+            self._raw_value = signal.function
+            self._name, self._instance, self._alt_position = self.parse_function(signal.function)
+            self.pack_sort_key()
+        else:
+            self._raw_value = signal.raw_value
+            self._name, self._instance, self._alt_position = parsed
+            self.sort_key = signal.sort_key
+
+        self.invalidate()
+
+        return
+
+    @property
+    def raw_value(self):
+        return self._raw_value
+
+    @raw_value.setter
+    def raw_value(self, raw_value):
+        if raw_value != self._raw_value:
+            self._raw_value = raw_value
+            self._name = None
+            self.invalidate()
+
+        return
+
     @property
     def name(self):
         """
@@ -144,11 +270,12 @@ class DxSignalFunction(DxFunction):
         Returns:
             name (str): the function name
         """
-        name, instance, alt_pos = self.parse_function(self.raw_value)
-        return name
+        if self._name is None:
+            self._name, instance, alt_pos = self.parse_function(self.raw_value)
 
-    @property
-    def text(self):
+        return self._name
+
+    def make_text(self):
         inst = ''
         if self.instance > 0:
             inst = '{}'.format(self.instance)
@@ -163,18 +290,15 @@ class DxSignalFunction(DxFunction):
 
     @property
     def instance(self):
-        name, instance, alt_pos = self.parse_function(self.signal.function)
-        return int(instance)
+        return self._instance
 
     @property
     def is_alt(self):
-        name, instance, alt_pos = self.parse_function(self.signal.function)
-        return int(alt_pos) > 0
+        return self._alt_position > 0
 
     @property
     def alt_position(self):
-        name, instance, alt_pos = self.parse_function(self.signal.function)
-        return int(alt_pos)
+        return self._alt_position
 
     @property
     def pad_name(self):
@@ -186,14 +310,8 @@ class DxSignalFunction(DxFunction):
 
     @footnotes.setter
     def footnotes(self, footnotes):
-        for footnote in footnotes:
-            if footnote.type.lower() == 'function' and footnote.key in self.signal.function:
-                self._footnotes.append(footnote.id)
-                print('  Function footnote found', self.signal.function)
-            if footnote.type.lower() == 'group' and footnote.key in self.signal.group:
-                self._footnotes.append(footnote.id)
-                print('  Group footnote found', self.signal.group)
-
+        self._footnotes.extend(match_footnotes(self.signal, footnotes))
+        self.invalidate()
         return
 
 
@@ -204,11 +322,11 @@ class DxPinFunction(DxFunction):
         super().__init__()
 
         self.pin_name = pin_name
+        self.pack_sort_key()
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         name = '{}'.format(self.name)
         return name
 
@@ -382,8 +500,7 @@ class PtcSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         name = '{}.{}'.format(self.signal.group, self.signal.index)
         return name
 
@@ -405,8 +522,7 @@ class AnalogSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         name = self.name
         if 'AIN' in name:
             name = 'ADC.{}'.format(self.signal.index)
@@ -437,8 +553,7 @@ class OpampSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         text = self.signal.group
         if 'INP' in text:
             text = text.replace('INP', '.IN+')
@@ -485,9 +600,8 @@ class SyncSerialSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
-        text = super().text.replace('_DUAL', '')
+    def make_text(self):
+        text = super().make_text().replace('_DUAL', '')
         return text
 
 sort_index += 1
@@ -563,8 +677,7 @@ class ComparatorSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         name = self.signal.function
         if '_ALT' in name:
             is_alt = True
@@ -686,8 +799,7 @@ class PwmSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         instance = ''
         if self.instance > 0:
             instance = self.instance
@@ -718,8 +830,7 @@ class TcaSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         instance = ''
         if self.instance > 0:
             instance = self.instance
@@ -749,8 +860,7 @@ class TcbSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         text = '{}{}'.format(self.name, self.instance)
         if self.is_alt:
             text += '/{}'.format(self.alt_position)
@@ -775,8 +885,7 @@ class TcdSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         instance = ''
         if self.instance > 0:
             instance = self.instance
@@ -806,8 +915,7 @@ class LogicSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         group = self.signal.group
         if group == 'EVOUT':
             text = 'EV.OUT'
@@ -878,8 +986,7 @@ class ControlSignalFunction(DxSignalFunction):
 
         return
 
-    @property
-    def text(self):
+    def make_text(self):
         text = self.signal.group
         text = text.replace('XTAL', 'XTL')
         
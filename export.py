@@ -0,0 +1,165 @@
+# export.py - raster and pdf export of rendered pages in a worker pool.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# pip install cairosvg
+# only needed when the page config has an 'export' section, for example
+#   "export": {"png": {"dpi": 150}, "pdf": {}, "thumbnail": {"width": 400}}
+# the gzip compressed "svgz": {} target needs no extra package.
+
+import os
+import gzip
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import cairosvg
+except ImportError:
+    cairosvg = None
+
+
+def export_svg(svg, target, path, options):
+    """
+    Convert an svg document to a png, thumbnail, pdf or svgz file.  Runs in a worker process.
+
+    Args:
+        svg (str): the svg document
+        target (str): one of 'png', 'thumbnail', 'pdf', 'svgz'
+        path (str): destination file path
+        options (dict): 'dpi', 'width' or 'height' of the output, 'level' of compression
+
+    Returns:
+        path (str): the file written
+    """
+    if target == 'svgz':
+        with gzip.open(path, 'wb', compresslevel=options.get('level', 9)) as fp:
+            fp.write(svg.encode())
+
+        return path
+
+    kwargs = dict(bytestring=svg.encode(), write_to=path)
+    if 'dpi' in options:
+        kwargs['dpi'] = options['dpi']
+    if 'width' in options:
+        kwargs['output_width'] = options['width']
+    if 'height' in options:
+        kwargs['output_height'] = options['height']
+
+    if target == 'pdf':
+        cairosvg.svg2pdf(**kwargs)
+    else:
+        cairosvg.svg2png(**kwargs)
+
+    return path
+
+
+def export_page(svg, exports):
+    """
+    Write every export target of one page.  Runs in a worker process, so the svg document
+    is sent to the pool once per page rather than once per target.
+
+    Args:
+        svg (str): the svg document
+        exports (list): (target, path, options) of each target
+
+    Returns:
+        paths (list): the files written
+    """
+    paths = []
+    for target, path, options in exports:
+        paths.append(export_svg(svg, target, path, options))
+
+    return paths
+
+
+class Exporter():
+    targets = dict(png='{}.png', thumbnail='{}.thumb.png', pdf='{}.pdf', svgz='{}.svgz')
+    cairo_targets = ['png', 'thumbnail', 'pdf']
+
+    def __init__(self, export_config):
+        """
+        Exports saved pages in a process pool so conversion overlaps rendering of the next page.
+
+        Args:
+            export_config (dict): target name -> options, and an optional 'workers' count
+        """
+        self.config = dict(export_config)
+        self.workers = self.config.pop('workers', None)
+
+        for target in self.config:
+            if target not in self.targets:
+                raise ValueError('unknown export target: {}'.format(target))
+
+        self.pool = None
+        self.futures = []
+
+        if any(target in self.cairo_targets for target in self.config) and cairosvg is None:
+            raise ImportError('export requires cairosvg: pip install cairosvg')
+
+        return
+
+    def submit(self, filepath, svg):
+        """
+        Queue the export targets of a saved page.
+
+        Args:
+            filepath (str): path of the saved svg
+            svg (str): the svg document of the page
+        """
+        if not self.config:
+            return
+
+        if self.pool is None:
+            # pages are submitted while layout threads may hold locks, and a forked child
+            # of a threaded process can inherit a lock that is never released
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=context)
+
+        name, suffix = os.path.splitext(filepath)
+        exports = []
+        for target, options in self.config.items():
+            exports.append((target, self.targets[target].format(name), options))
+
+        self.futures.append(self.pool.submit(export_page, svg, exports))
+
+        self.collect()
+        return
+
+    def collect(self, wait=False):
+        # report finished exports and drop them along with their svg documents.
+        pending = []
+        for future in self.futures:
+            if wait or future.done():
+                for path in future.result():
+                    print('Exported {}'.format(path))
+            else:
+                pending.append(future)
+
+        self.futures = pending
+        return
+
+    def close(self):
+        """
+        Wait for all queued exports to finish.
+        """
+        self.collect(wait=True)
+
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+        return
@@ -0,0 +1,113 @@
+# layout.py - cheap footprint estimates for choosing a pinout layout.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import math
+
+
+class LayoutEstimate():
+    layouts = ['horizontal', 'diagonal', 'orthogonal']
+
+    def __init__(self, pinmap, shape, pin_count, pitch=30, gap=5):
+        """
+        Estimate the footprint of each pinout layout from label counts and widths
+        without placing anything.
+
+        Args:
+            pinmap (DxPinmap): a built pinmap
+            shape (str): package shape, one of 'sop', 'qfp', 'qfn'
+            pin_count (int): number of package pins
+            pitch (int): vertical space taken by one row of labels
+            gap (int): space between adjacent labels in a row
+        """
+        self.shape = shape
+        self.pitch = pitch
+        self.gap = gap
+
+        self.sides = 2 if shape == 'sop' else 4
+        self.pins_per_side = math.ceil(pin_count / self.sides)
+
+        # widest row of labels on each side of the package
+        self.row_widths = [0] * self.sides
+        for position, functions in pinmap.functions.items():
+            side = min((position - 1) // self.pins_per_side, self.sides - 1)
+
+            labels = [function for function in functions if not function.skip]
+            width = sum(label.width + self.gap for label in labels)
+            width += pinmap.get_pin_by_position(position).width + self.gap
+
+            self.row_widths[side] = max(self.row_widths[side], width)
+
+        return
+
+    @property
+    def body(self):
+        return self.pins_per_side * self.pitch
+
+    def footprint(self, layout):
+        """
+        Returns:
+            width, height: estimated size of the placed pinout
+        """
+        if self.sides == 2:
+            # a dual row package only has left and right rows, which every layout
+            # places the same way, so the estimate can not tell the layouts apart
+            width = self.body + self.row_widths[0] + self.row_widths[1]
+            height = self.body
+            return width, height
+
+        left, bottom, right, top = self.row_widths
+
+        if layout == 'horizontal':
+            # every row runs sideways, top and bottom rows stack above and below
+            width = self.body + 2 * max(self.row_widths)
+            height = self.body + 2 * self.body
+        elif layout == 'diagonal':
+            # rows leave the corners at 45 degrees
+            diagonal = math.sqrt(0.5)
+            width = self.body + (max(left, top, bottom) + max(right, top, bottom)) * diagonal
+            height = self.body + (max(top, left, right) + max(bottom, left, right)) * diagonal
+        else:
+            # rows run perpendicular to their side
+            width = self.body + left + right
+            height = self.body + top + bottom
+
+        return width, height
+
+    def scale(self, layout, width, height):
+        """
+        Returns:
+            scale (float): how far the layout overfills the area. smaller is better
+        """
+        footprint_width, footprint_height = self.footprint(layout)
+        return max(footprint_width / width, footprint_height / height)
+
+    def choose(self, width, height):
+        """
+        Pick the layout that best fits an area.  Dual row (sop) packages always get
+        'horizontal', since their footprint is the same in every layout.
+
+        Args:
+            width (float): available width
+            height (float): available height
+
+        Returns:
+            layout (str): one of 'horizontal', 'diagonal', 'orthogonal'
+        """
+        if self.sides == 2:
+            return 'horizontal'
+
+        return min(self.layouts, key=lambda layout: self.scale(layout, width, height))
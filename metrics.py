@@ -0,0 +1,108 @@
+# metrics.py - text widths summed from per glyph advances.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# PIL's basic layout places every glyph at its hinted advance, so the width of a string
+# is the sum of the advances of its characters.  each advance is taken from freetype once
+# per glyph and size, then every width is plain arithmetic.  the font's cmap tells which
+# strings that covers.  GoogleFont measures with PIL's ImageFont.getlength instead when
+# fontTools is not installed, a font can not be read or raqm lays text out.
+
+try:
+    from fontTools.ttLib import TTFont
+except ImportError:
+    TTFont = None
+
+from PIL import features
+
+import stats
+
+
+def layout_engine():
+    """
+    Which layout PIL uses.  Only basic layout is measured here: it places glyphs at their
+    hinted advances and its kerning is at most a fraction of a pixel per pair, so it is
+    left out.  Raqm shapes and kerns whole strings, which per glyph sums do not model.
+
+    Returns:
+        basic (bool): basic layout is in use
+    """
+    return not features.check('raqm')
+
+
+class GlyphMetrics():
+    def __init__(self, font_path):
+        """
+        The characters one font file has glyphs for.
+
+        Args:
+            font_path (str): ttf file
+        """
+        font = TTFont(font_path, lazy=True)
+
+        self.glyphs = font.getBestCmap()  # code point -> glyph name
+
+        if stats.enabled:
+            stats.count('glyph_tables')
+
+        font.close()
+        return
+
+    def covers(self, text):
+        return all(ord(char) in self.glyphs for char in text)
+
+
+class SizedMetrics():
+    # getlength() for one font size, the part of ImageFont that text layout uses.
+    def __init__(self, metrics, size, image_font):
+        """
+        Args:
+            metrics (GlyphMetrics): glyph coverage of the font
+            size (int): font size in pixels
+            image_font (callable): returns the ImageFont of this size, which measures
+                each glyph once and every string the font does not cover
+        """
+        self.metrics = metrics
+        self.size = size
+        self.image_font = image_font
+
+        self.advances = dict()   # char -> hinted advance in pixels
+        return
+
+    def advance(self, char):
+        advance = self.advances.get(char)
+        if advance is None:
+            advance = self.image_font().getlength(char)
+            self.advances[char] = advance
+
+        return advance
+
+    def getlength(self, text):
+        """
+        Args:
+            text (str): a single line of text
+
+        Returns:
+            length (float): advance width of text in pixels
+        """
+        if not self.metrics.covers(text):
+            return self.image_font().getlength(text)
+
+        length = 0
+        for char in text:
+            length += self.advance(char)
+
+        return length
@@ -14,20 +14,37 @@ class Note(TextBlock):
         self.style['font_weight'] = ''
         self.style['font_family'] = 'Roboto'
 
-        self.cache = GoogleFont(self.style)
+        self._margin = self.style['font_size'] * 3
         return
 
     @property
     def margin(self):
-        return self.style['font_size'] * 3
+        # fixed by the initial font size, so fitting the font does not move the block
+        return self._margin
+
+
+class FootnoteContext():
+    # footnote id allocation for one page. pages rendered side by side each number from 1.
+    def __init__(self):
+        self.last_id = 0
+        return
+
+    def next_id(self):
+        self.last_id += 1
+        return self.last_id
 
 
 class Footnote():
-    _last_id = 0
+    def __init__(self, footnote, context):
+        """
 
-    def __init__(self, footnote):
+        Args:
+            footnote (dict): footnote config with type, key and text
+            context (FootnoteContext): allocates the id on first use
+        """
         self._id = 0
         self._footnote = footnote
+        self.context = context
 
         if self.type =='constant':
             id = self.id
@@ -41,7 +58,7 @@ class Footnote():
     @property
     def id(self):
         if self._id == 0:
-            self._id = self.next_id()
+            self._id = self.context.next_id()
 
         return self._id
 
@@ -57,19 +74,12 @@ class Footnote():
     def text(self):
         return self._footnote['text']
 
-    @classmethod
-    def next_id(cls):
-        cls._last_id += 1
-        return cls._last_id
-
 
 class Footnotes(Note):
-    def __init__(self, footnotes=None, reset=False):
+    def __init__(self, footnotes=None):
         super().__init__('')
 
-        if reset:
-            Footnote._last_id = 0
-
+        self.context = FootnoteContext()
         self.footnotes = []
         if footnotes is not None:
             self.append(footnotes)
@@ -82,7 +92,7 @@ class Footnotes(Note):
 
     def append(self, footnotes):
         for footnote in footnotes:
-            self.footnotes.append(Footnote(footnote))
+            self.footnotes.append(Footnote(footnote, self.context))
 
         return
 
@@ -96,24 +106,13 @@ class Footnotes(Note):
         self.footnotes.sort(key=lambda footnote: footnote._id)
         return
 
-    def generate(self, width):
-        self.width = width
-
-        style = dict(self.style)
-        if 'font_size' in style:
-            del style['font_size']
-
-        x = 0
-        y = 0
+    @property
+    def strings(self):
         self.sort()
+
+        strings = []
         for footnote in self.footnotes:
             if footnote.is_used:
-                text = '{}. {}'.format(footnote.id, footnote.text)
-                lines, height = self.wrap_string(text, self.width)
-                super().append(dw.Text(lines, self.font_size, x=x, y=y, **style))
-                y += height
-
-        self.height = y - self.font_size
-
-        return
+                strings.append('{}. {}'.format(footnote.id, footnote.text))
 
+        return strings
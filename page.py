@@ -16,11 +16,15 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
+import time
+import threading
+from collections import OrderedDict
 
 import drawsvg as dw
 import pinoutOverview as Overview
 from text import Text, GoogleFontCache
 from notes import Note, Footnotes
+import stats
 
 
 class Border(Overview.Region):
@@ -79,14 +83,69 @@ class Header(Overview.Region):
 
 
 
+class FragmentCache():
+    def __init__(self, size=16):
+        """
+        Page regions, and the wrapped lines of notes, made once and shared by the pages of
+        every family or a server, keyed by content, position or width and style.  drawsvg
+        assigns ids per drawing, so a rendered region can be appended to any number of
+        pages.  Fragments are never placed or changed again once cached, so threads may
+        share them.
+
+        Args:
+            size (int): number of fragments to keep, least recently used are dropped
+        """
+        self.size = size
+        self.fragments = OrderedDict()
+        self.lock = threading.Lock()
+        return
+
+    def get(self, key, build):
+        """
+        Args:
+            key (tuple): hashable content, position and style of the region
+            build (callable): renders the region on a miss
+
+        Returns:
+            fragment: the rendered region
+        """
+        with self.lock:
+            fragment = self.fragments.get(key)
+            if fragment is not None:
+                self.fragments.move_to_end(key)
+                return fragment
+
+        fragment = build()
+        if stats.enabled:
+            stats.count('fragments')
+
+        with self.lock:
+            self.fragments[key] = fragment
+            while len(self.fragments) > self.size:
+                self.fragments.popitem(last=False)
+
+        return fragment
+
+    def clear(self):
+        with self.lock:
+            self.fragments.clear()
+
+        return
+
+
+def style_key(style):
+    return tuple(sorted(style.items()))
+
+
 class Page():
-    def __init__(self, page_config, pinout, legend, footnotes):
+    def __init__(self, page_config, pinout, legend, footnotes, fragments=None):
         self.canvas_height = page_config.get('height', 1000)
         self.canvas_width = page_config.get('width', 1000)
 
         self.header = Header(page_config['header'])
         self.footer = Header(page_config['footer'])
         self.notes = page_config['notes']
+        self.notes_fit = page_config.get('notes_fit', None)
 
         self.pinout = pinout
         self.legend = legend
@@ -96,6 +155,12 @@ class Page():
         self.package_y_offset = 0
 
         self.dw_page = dw.Drawing(self.canvas_width, self.canvas_height, origin='center')
+        self._svg = None
+        # shared with the other pages of the family when given
+        self.fragments = fragments if fragments is not None else FragmentCache()
+
+        # seconds spent in each stage of building the page
+        self.timings = dict()
 
         return
 
@@ -124,12 +189,16 @@ class Page():
         # Attach Header
         x = 0
         y = border.top + self.header.height
-        self.dw_page.append(self.header.place(x, y))
+        self.header = self.fragments.get(self.header_key(self.header, x, y),
+                                         lambda: self.header.place(x, y))
+        self.dw_page.append(self.header)
 
         # Attach Footer
         x = 0
         y = border.bottom - self.footer.height
-        self.dw_page.append(self.footer.place(x, y))
+        self.footer = self.fragments.get(self.header_key(self.footer, x, y),
+                                         lambda: self.footer.place(x, y))
+        self.dw_page.append(self.footer)
 
         # attach pinout
         self.dw_page.append(self.pinout.place(0, 0))
@@ -149,7 +218,13 @@ class Page():
                 x = (self.pinout.width / 2 + note.margin) * self.rightward
                 width = (border.right - note.margin) - x
 
-            note.generate(abs(width))
+            height = None
+            if self.notes_fit is not None:
+                height = self.note_height(index, border, note)
+
+            # the space for a note follows the variant's pinout, so notes are drawn per page
+            # from lines wrapped once per content, space and style
+            self.generate_note(note, abs(width), height)
 
             if index in [0, 1]:
                 # y = self.header.bottom + self.pinout.height / 2
@@ -168,6 +243,38 @@ class Page():
 
         return
 
+    def header_key(self, header, x, y):
+        items = tuple((item.value, style_key(item.style)) for item in header.items)
+        return ('header', items, x, y)
+
+    def note_key(self, note, width, height):
+        fit = None if height is None else style_key(self.notes_fit)
+        return ('note', tuple(note.strings), width, height, fit, style_key(note.style))
+
+    def generate_note(self, note, width, height):
+        font_size, wrapped = self.fragments.get(self.note_key(note, width, height),
+                                                lambda: self.wrap_note(note, width, height))
+
+        note.style['font_size'] = font_size
+        note.generate(width, wrapped)
+        return note
+
+    def wrap_note(self, note, width, height):
+        # the fitted font size and wrapped lines, the costly part of a note
+        if height is not None:
+            note.fit(width, height, **self.notes_fit)
+
+        return note.style['font_size'], note.wrap(width)
+
+    def note_height(self, index, border, note):
+        # space between the header and the pinout, or the pinout and the footer
+        if index in [0, 1]:
+            height = (self.pinout.top - note.margin) - (border.top + 2 * self.header.height)
+        else:
+            height = (border.bottom - 2 * self.footer.height) - (self.pinout.bottom + note.margin)
+
+        return height
+
     def embed_fonts(self):
         cache = GoogleFontCache()
 
@@ -176,14 +283,45 @@ class Page():
 
         return
 
-    def save(self, name):
-        self.generate()
+    def release(self):
+        # drop the drawing and everything placed on it. the page can not be saved again.
+        self.dw_page = None
+        self._svg = None
+
+        self.header = None
+        self.footer = None
+        self.notes = None
+        self.fragments = None
+
+        self.pinout = None
+        self.legend = None
+        self.footnotes = None
+
+        return
+
+    def as_svg(self):
+        # generate and serialize the drawing once, savers and exporters share the result.
+        if self._svg is None:
+            start = time.perf_counter()
+            self.generate()
+            self.timings['layout'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            self._svg = self.dw_page.as_svg()
+            self.timings['serialize'] = time.perf_counter() - start
+
+            if stats.enabled:
+                stats.count('svg_elements', sum(stats.count_elements(element) for element in self.dw_page.elements))
+
+        return self._svg
 
+    def save(self, name, directory=''):
         basename = os.path.basename(name)
         name, suffix = os.path.splitext(basename)
-        name = '{}.svg'.format(name)
+        name = os.path.join(directory, '{}.svg'.format(name))
 
-        self.dw_page.save_svg(name)
+        with open(name, 'w', encoding='utf-8') as fp:
+            fp.write(self.as_svg())
 
         return name
 
@@ -0,0 +1,191 @@
+# pinmap_export.py - Application. writes pinmaps as json, csv or kicad symbols, without rendering.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import csv
+import json
+import argparse
+
+import microchip_dfp as Dfpack
+
+from pinout import Pages, atdf_path, build_footnotes, build_pinmap
+from config import LayeredConfig
+from dx_functions import VddPinFunction, VssPinFunction, MvioVddPinFunction
+
+
+def pinmap_rows(pinmap):
+    """
+    Walk a built pinmap in pin order.
+
+    Args:
+        pinmap (DxPinmap): a built pinmap
+
+    Returns:
+        generator of (position, pin label, [signal function, ...]).  Skipped functions are left out.
+    """
+    for position in sorted(pinmap.functions):
+        functions = [function for function in pinmap.functions[position] if not function.skip]
+        yield position, pinmap.get_pin_by_position(position), functions
+
+    return
+
+
+def function_record(function):
+    return dict(
+        function=function.signal.function,
+        group=function.signal.group,
+        index=function.signal.index,
+        type=function.title,
+        name=function.name,
+        instance=function.instance,
+        alt_position=function.alt_position,
+        text=function.text,
+        footnotes=list(function.footnotes)
+    )
+
+
+class JsonExporter():
+    suffix = 'json'
+
+    def write(self, fp, name, pinmap):
+        fp.write('{{"device": {}, "pads": [\n'.format(json.dumps(name)))
+
+        separator = ''
+        for position, pin, functions in pinmap_rows(pinmap):
+            pad = dict(
+                position=position,
+                pad=pin.name,
+                type=pin.title,
+                functions=[function_record(function) for function in functions]
+            )
+
+            fp.write(separator + json.dumps(pad))
+            separator = ',\n'
+
+        fp.write('\n]}\n')
+        return
+
+
+class CsvExporter():
+    suffix = 'csv'
+    fields = ['position', 'pad', 'pad_type', 'function', 'group', 'index', 'type',
+              'name', 'instance', 'alt_position', 'text', 'footnotes']
+
+    def write(self, fp, name, pinmap):
+        writer = csv.DictWriter(fp, fieldnames=self.fields)
+        writer.writeheader()
+
+        for position, pin, functions in pinmap_rows(pinmap):
+            for function in functions:
+                row = function_record(function)
+                row.update(position=position, pad=pin.name, pad_type=pin.title)
+                row['footnotes'] = ' '.join(str(id) for id in row['footnotes'])
+                writer.writerow(row)
+
+        return
+
+
+class KicadExporter():
+    # kicad 6+ symbol library. signal functions become pin alternates.
+    suffix = 'kicad_sym'
+    pitch = 2.54
+    pin_length = 5.08
+    body_width = 25.4
+
+    def quote(self, value):
+        return '"{}"'.format(str(value).replace('\\', '\\\\').replace('"', '\\"'))
+
+    def pin_type(self, pin):
+        if isinstance(pin, (VddPinFunction, VssPinFunction, MvioVddPinFunction)):
+            return 'power_in'
+
+        return 'bidirectional'
+
+    def write(self, fp, name, pinmap):
+        font = '(effects (font (size 1.27 1.27)))'
+        rows = list(pinmap_rows(pinmap))
+
+        left_count = (len(rows) + 1) // 2
+        half_height = left_count * self.pitch / 2 + self.pitch
+        half_width = self.body_width / 2
+
+        fp.write('(kicad_symbol_lib (version 20211014) (generator dx_pinouts)\n')
+        fp.write('  (symbol {} (in_bom yes) (on_board yes)\n'.format(self.quote(name)))
+        fp.write('    (property "Reference" "U" (id 0) (at 0 {:.2f} 0) {})\n'.format(half_height + self.pitch, font))
+        fp.write('    (property "Value" {} (id 1) (at 0 {:.2f} 0) {})\n'.format(self.quote(name), -half_height - self.pitch, font))
+        fp.write('    (symbol {} (rectangle (start {:.2f} {:.2f}) (end {:.2f} {:.2f}) '
+                 '(stroke (width 0.254) (type default)) (fill (type background))))\n'.format(
+                     self.quote('{}_0_1'.format(name)), -half_width, half_height, half_width, -half_height))
+
+        fp.write('    (symbol {}\n'.format(self.quote('{}_1_1'.format(name))))
+        for i, (position, pin, functions) in enumerate(rows):
+            # first half down the left side, second half up the right side
+            if i < left_count:
+                x = -half_width - self.pin_length
+                y = half_height - self.pitch * (i + 1)
+                rotation = 0
+            else:
+                x = half_width + self.pin_length
+                y = -half_height + self.pitch * (i - left_count + 1)
+                rotation = 180
+
+            pin_type = self.pin_type(pin)
+            fp.write('      (pin {} line (at {:.2f} {:.2f} {}) (length {:.2f}) (name {} {}) (number {} {})'.format(
+                pin_type, x, y, rotation, self.pin_length, self.quote(pin.name), font, self.quote(position), font))
+
+            texts = []
+            for function in functions:
+                if function.text not in texts:
+                    texts.append(function.text)
+
+            for text in texts:
+                fp.write('\n        (alternate {} {} line)'.format(self.quote(text), pin_type))
+
+            fp.write(')\n')
+
+        fp.write('    )\n')
+        fp.write('  )\n')
+        fp.write(')\n')
+        return
+
+
+exporters = dict(json=JsonExporter, csv=CsvExporter, kicad=KicadExporter)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the pinmaps of a family config file as data.')
+    parser.add_argument('config', nargs='?', default='da.json', help='family config file')
+    parser.add_argument('--format', nargs='+', choices=sorted(exporters), default=['json'],
+                        help='one or more output formats')
+    args = parser.parse_args()
+
+    pages = Pages(args.config)
+    for key, variant_config in pages.variants():
+        footnotes = build_footnotes(LayeredConfig(pages.page_config, variant_config))
+        atdf = Dfpack.Atdf(atdf_path(pages.page_config, variant_config))
+        pinmap = build_pinmap(atdf, footnotes, pages.pool)
+
+        name = variant_config['part_family']
+        for format in args.format:
+            exporter = exporters[format]()
+            path = '{}.{}'.format(name, exporter.suffix)
+
+            with open(path, 'w', newline='') as fp:
+                exporter.write(fp, atdf.devices[0].name, pinmap)
+
+            print('Exported {}'.format(path))
+
+    exit()
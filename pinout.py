@@ -16,15 +16,28 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
-import copy
+import time
+import math
 import json
+import fnmatch
+import argparse
+from operator import attrgetter
 
 import microchip_dfp as Dfpack
 import pinoutOverview as Overview
 
-from page import Page
+from page import Page, FragmentCache
+from text import Text, GoogleFontCache, measure_texts
+from layout import LayoutEstimate
+from export import Exporter
+from batch import render_batch
+from pipeline import Pipeline
+from stats import StatsReport
+import stats
 from dx_functions import PinFunctionFactory, SignalFunctionFactory
-from notes import Footnotes
+from signals import SignalPool
+from notes import Note, Footnotes
+from config import LayeredConfig, page_defaults
 
 
 class DxPackage(Overview.Package):
@@ -61,32 +74,174 @@ class DxPackage(Overview.Package):
 
         return shape, pin_count
 
+sort_key = attrgetter('sort_key')
+
+
 class DxPinmap(Overview.Pinmap):
-    def __init__(self, pinmap):
+    def __init__(self, pinmap, pool=None):
+        """
+
+        Args:
+            pinmap: atdf pinout, an iterable of pad and position mappings
+            pool (SignalPool): family pool of shared signal records, or None
+        """
         super().__init__()
 
+        self.pool = pool
+
         self.reverse_map = dict()
+        self.pins = dict()
+        self.functions = dict()
+        self.categories = dict()  # function class -> [count, first seen function]
         for mapping in pinmap:
             self.reverse_map[mapping.pad] = int(mapping.position)
+            self.functions[int(mapping.position)] = []
 
             function_label = PinFunctionFactory(mapping.pad)
+            self.pins[int(mapping.position)] = function_label
+            self.count(function_label)
+
             pad = Overview.Pad(function_label)
             self.data[int(mapping.position)] = pad
 
         return
 
+    def count(self, function):
+        category = self.categories.get(type(function))
+        if category is None:
+            self.categories[type(function)] = [1, function]
+        else:
+            category[0] += 1
+
+        return
+
+    def legend_pinmap(self):
+        """
+        A pinmap with one pad per function class, holding that class's first seen function.
+        Overview.Legend scans it in O(categories) instead of scanning every pad.
+
+        Returns:
+            Overview.Pinmap
+        """
+        pinmap = Overview.Pinmap()
+
+        categories = sorted(self.categories.values(), key=lambda category: category[1].type_index)
+        for position, (count, function) in enumerate(categories, 1):
+            if not function.skip:
+                pinmap.data[position] = Overview.Pad(function)
+
+        return pinmap
+
+    def summary(self):
+        """
+        Returns:
+            summary (list): (title, count) of each function class, in legend order
+        """
+        categories = sorted(self.categories.values(), key=lambda category: category[1].type_index)
+        return [(function.title, count) for count, function in categories if not function.skip]
+
+    def sort(self, key=None):
+        """
+        In-place sort of each pad's functions, by their packed sort keys unless key is given.
+        The Overview pads are rebuilt in the new order.
+
+        Args:
+            key (function): optional sort key of a function
+        """
+        if key is None:
+            key = sort_key
+
+        for position, functions in self.functions.items():
+            functions.sort(key=key)
+
+            pad = Overview.Pad(self.pins[position])
+            for function in functions:
+                pad.append(function)
+
+            self.data[position] = pad
+
+        return
+
     def get_pad_by_name(self, pad_name):
         return self.data[self.reverse_map[pad_name]]
 
     def get_pad_by_position(self, index):
         return self.data[int(index)]
 
+    def get_pin_by_position(self, index):
+        return self.pins[int(index)]
+
+    label_style = dict(font_family='Roboto Mono', font_size=12, font_weight='bold')
+
+    def texts(self):
+        """
+        Every signal label text of the pinmap at once, grouped by label font, for batch measurement.
+
+        Returns:
+            texts (dict): font style items -> [(function, text), ...] in pin order
+        """
+        groups = dict()
+        for position in sorted(self.functions):
+            for function in self.functions[position]:
+                style = dict(self.label_style)
+                style.update((key, function.text_style[key]) for key in self.label_style if key in function.text_style)
+                groups.setdefault(tuple(style.items()), []).append((function, function.text))
+
+        return groups
+
+    def size_labels(self, mode='label', quantum=10, padding=10, minimum=30):
+        """
+        Size signal function labels to fit their text.  All label texts are measured in one pass.
+
+        Args:
+            mode (str): 'label' sizes each label to its own text,
+                        'column' sizes each column of labels to its widest text
+            quantum (int): widths are rounded up to a multiple of quantum
+            padding (int): space added to the text length
+            minimum (int): smallest label width
+        """
+        lengths = dict()
+        for key, labels in self.texts().items():
+            measured = measure_texts((text for function, text in labels), dict(key))
+            for function, text in labels:
+                lengths[id(function)] = measured[text]
+
+        def quantize(length):
+            width = math.ceil((length + padding) / quantum) * quantum
+            return max(width, minimum)
+
+        if mode == 'label':
+            for functions in self.functions.values():
+                for function in functions:
+                    function.width = quantize(lengths[id(function)])
+
+        elif mode == 'column':
+            # columns in the order sort() draws the labels, whether or not it has run yet
+            rows = []
+            for functions in self.functions.values():
+                rows.append([function for function in sorted(functions, key=sort_key) if not function.skip])
+
+            columns = dict()
+            for labels in rows:
+                for column, function in enumerate(labels):
+                    columns[column] = max(columns.get(column, 0), lengths[id(function)])
+
+            for labels in rows:
+                for column, function in enumerate(labels):
+                    function.width = quantize(columns[column])
+
+        else:
+            raise ValueError('unknown label sizing mode: {}'.format(mode))
+
+        return
+
     def append_module(self, module, footnotes):
         """
 
         Args:
-            module:
-            footnotes (list): A list of all possible footnotes
+            module: atdf module object
+            footnotes (Footnotes): all possible footnotes of the page. matched footnotes
+                                   take their ids from the page's footnote context.
         """
 
         for name, instance in module.instances.items():
@@ -94,33 +249,124 @@ class DxPinmap(Overview.Pinmap):
                 continue
 
             for signal in instance.signals:
-                function = SignalFunctionFactory(signal=signal)
-                function.footnotes = footnotes
+                if self.pool is None:
+                    function = SignalFunctionFactory(signal=signal)
+                    function.footnotes = footnotes
+                else:
+                    # the pooled text was made once for the family, reuse it on every page
+                    record = self.pool.record(signal)
+                    function = record.cls(signal=record)
+                    function.footnotes = footnotes
+                    function.seed_text(record.text)
+
+                self.append_function(signal.pad, function)
+
+        return
 
-                self.get_pad_by_name(signal.pad).append(function)
+    def append_function(self, pad_name, function):
+        self.get_pad_by_name(pad_name).append(function)
+        self.functions[self.reverse_map[pad_name]].append(function)
+        self.count(function)
 
         return
 
 
+def atdf_path(page_config, variant_config):
+    # a variant may keep its atdf in another directory than the family
+    config = LayeredConfig(page_config, variant_config)
+    atdf_home = os.path.expanduser(config['atdf_home'])
+    atdf_name = config['atdf_name']
+
+    return '{}/{}'.format(atdf_home, atdf_name)
+
+
+def build_footnotes(config):
+    """
+    Args:
+        config (LayeredConfig): page config, family and variant footnotes merge
+
+    Returns:
+        footnotes (Footnotes): the footnotes of the page
+    """
+    footnotes = Footnotes()
+    if 'footnotes' in config:
+        footnotes.append(config['footnotes'])
+
+    return footnotes
+
+
+def build_pinmap(atdf, footnotes, pool=None):
+    """
+    Build the sorted pinmap of the first variant of an atdf.  No fonts or drawing involved.
+
+    Args:
+        atdf: microchip_dfp Atdf
+        footnotes (Footnotes): footnotes to match against the signals
+        pool (SignalPool): family pool of shared signal records, or None
+
+    Returns:
+        DxPinmap
+    """
+    variant = atdf.variants[0]
+
+    map = atdf.pinouts[variant.pinout]
+    pinmap = DxPinmap(map, pool)
+
+    device = atdf.devices[0]
+    for module in device.peripherals:
+        pinmap.append_module(module, footnotes)
+
+    pinmap.sort()
+
+    return pinmap
+
+
+class AtdfCache():
+    def __init__(self):
+        """
+        Parsed atdfs kept for reuse by later pages.  An atdf is parsed again when its file changes.
+        """
+        self.atdfs = dict()
+        return
+
+    def load(self, path):
+        mtime = os.path.getmtime(path)
+        if path not in self.atdfs or self.atdfs[path][0] != mtime:
+            self.atdfs[path] = (mtime, Dfpack.Atdf(path))
+
+        return self.atdfs[path][1]
+
+
 class DxPage(Page):
-    def __init__(self, page_config, variant_config):
+    def __init__(self, page_config, variant_config, atdfs=None, pool=None, output_dir='', fragments=None):
+        """
+
+        Args:
+            page_config (dict): the family wide 'page' section of the config, not modified
+            variant_config (dict): the variant section of the config, not modified
+            atdfs (AtdfCache): parsed atdfs to reuse, or None to parse the atdf for this page only
+            pool (SignalPool): family pool of shared signal records, or None
+            output_dir (str): directory save() writes to
+            fragments (FragmentCache): rendered headers and footers shared with other pages, or None
+        """
         self.page_config = page_config
         self.variant_config = variant_config
+        self.atdfs = atdfs
+        self.pool = pool
+        self.output_dir = output_dir
 
-        if 'notes' in self.variant_config:
-            for i, note in enumerate(self.variant_config['notes']):
-                if len(note) > 0:
-                    self.page_config['notes'][i] = note
-
-        footnotes = Footnotes(reset=True)
-        if 'footnotes' in self.page_config:
-            footnotes.append(self.page_config['footnotes'])
+        # page settings with the variant's overrides, notes and footnotes merged
+        self.config = LayeredConfig(page_defaults, self.page_config, self.variant_config)
 
-        if 'footnotes' in self.variant_config:
-            footnotes.append(self.variant_config['footnotes'])
+        footnotes = build_footnotes(self.config)
 
+        start = time.perf_counter()
         atdf = self.load_atdf(self.variant_config)
+        parse_time = time.perf_counter() - start
+
+        start = time.perf_counter()
         pinmap = self.build_pinmap(atdf, footnotes)
+        classify_time = time.perf_counter() - start
 
         appdata = dict(
             text1=self.variant_config['part_range'],
@@ -129,41 +375,65 @@ class DxPage(Page):
         package = DxPackage(self.variant_config['package'], appdata)
 
         layout = self.variant_config['layout']
+        if layout == 'auto':
+            layout = self.choose_layout(pinmap, package)
+
         pinout = Overview.Pinout(layout, pinmap, package)
-        legend = Overview.Legend(pinmap)
+        legend = Overview.Legend(pinmap.legend_pinmap())
 
-        super().__init__(self.page_config, pinout, legend, footnotes)
+        super().__init__(self.config, pinout, legend, footnotes, fragments)
+
+        self.timings['parse'] = parse_time
+        self.timings['classify'] = classify_time
         return
 
     def save(self, filepath=None):
         if filepath is None:
             filepath = self.variant_config['part_family']
 
-        filepath = super().save(filepath)
+        filepath = super().save(filepath, self.output_dir)
 
         return filepath
 
+    def release(self):
+        super().release()
+
+        self.config = None
+        self.page_config = None
+        self.variant_config = None
+        self.atdfs = None
+        self.pool = None
+
+        return
+
+    def choose_layout(self, pinmap, package):
+        shape, pin_count = package.parse_variant_package(self.variant_config['package'])
+        estimate = LayoutEstimate(pinmap, shape, pin_count)
+
+        width = self.config['width']
+        height = self.config['height']
+        layout = estimate.choose(width, height)
+
+        print('  auto layout: {}'.format(layout))
+        return layout
+
     def load_atdf(self, variant_config):
-        atdf_home = os.path.expanduser(self.page_config['atdf_home'])
-        atdf_name = variant_config['atdf_name']
+        path = atdf_path(self.page_config, variant_config)
+
+        if self.atdfs is not None:
+            return self.atdfs.load(path)
 
-        atdf_path = '{}/{}'.format(atdf_home, atdf_name)
-        atdf = Dfpack.Atdf(atdf_path)
+        atdf = Dfpack.Atdf(path)
 
         return atdf
 
     def build_pinmap(self, atdf, footnotes):
-        variant = atdf.variants[0]
+        pinmap = build_pinmap(atdf, footnotes, self.pool)
 
-        map = atdf.pinouts[variant.pinout]
-        pinmap = DxPinmap(map)
+        label_width = self.config.get('label_width')
+        if label_width is not None:
+            pinmap.size_labels(**label_width)
 
-        device = atdf.devices[0]
-        for module in device.peripherals:
-            pinmap.append_module(module, footnotes)
-
-
-        pinmap.sort()
         # split_functions = Overview.Functions()
         # split_functions.append(dx_functions.PwmSignalFunction(None))
         # pinmap.split(split_functions)
@@ -171,29 +441,100 @@ class DxPage(Page):
         return pinmap
 
 class Pages:
-    def __init__(self, config_name):
+    def __init__(self, config_name, only=None, exclude=None, atdfs=None, output_dir='', fragments=None):
+        """
+
+        Args:
+            config_name (str): family config file
+            only (list): glob patterns, render only the variants whose key matches one
+            exclude (list): glob patterns, skip the variants whose key matches one
+            atdfs (AtdfCache): parsed atdfs shared with other families, or None
+            output_dir (str): directory the family's pages are saved to
+            fragments (FragmentCache): rendered fragments shared with other families, or None
+        """
         self.config = self.load(config_name)
+        self.config_name = '{}.json'.format(os.path.splitext(config_name)[0])
+        self.pool = SignalPool()
+        self.atdfs = atdfs
+        self.fragments = fragments if fragments is not None else FragmentCache()
+
+        self.only = only
+        self.exclude = exclude
+
+        self.output_dir = output_dir
         return
 
     @property
     def page_config(self):
         return self.config['page']
 
-    def __iter__(self):
+    def variants(self):
         for key in self.config:
             if key.lower() == 'page':
                 continue
 
-            page_config = copy.deepcopy(self.page_config)
-            variant_config = self.config[key]
+            if self.only and not any(fnmatch.fnmatchcase(key, pattern) for pattern in self.only):
+                continue
 
-            yield DxPage(page_config, variant_config)
+            if self.exclude and any(fnmatch.fnmatchcase(key, pattern) for pattern in self.exclude):
+                continue
+
+            yield key, self.config[key]
+
+        return
+
+    def plan(self):
+        """
+        Describe the pages that would be rendered, without loading atdfs or fonts.
+
+        Returns:
+            lines (list): one or more lines per planned page
+        """
+        font_cache = GoogleFontCache()
+        fonts = ', '.join('{} ({})'.format(name, 'cached' if font_cache.is_cached(name) else 'download') for name in self.font_names())
+
+        lines = ['{}: fonts {}'.format(self.config_name, fonts)]
+        for key, variant_config in self.variants():
+            path = self.atdf_path(variant_config)
+            output = os.path.join(self.output_dir, '{}.svg'.format(os.path.basename(variant_config['part_family'])))
+
+            if not os.path.exists(path):
+                atdf_status = 'missing'
+                output_status = 'will fail'
+            else:
+                atdf_status = 'found'
+                newest_input = max(os.path.getmtime(path), os.path.getmtime(self.config_name))
+                if not os.path.exists(output):
+                    output_status = 'new'
+                elif os.path.getmtime(output) < newest_input:
+                    output_status = 'stale'
+                else:
+                    output_status = 'up to date'
+
+            lines.append('  {} -> {} ({})'.format(key, output, output_status))
+            lines.append('    atdf {} ({}), layout {}, package {}'.format(
+                path, atdf_status, variant_config['layout'], variant_config['package']))
+
+        return lines
+
+    def atdf_path(self, variant_config):
+        return atdf_path(self.page_config, variant_config)
+
+    def page(self, variant_config):
+        return DxPage(self.page_config, variant_config, atdfs=self.atdfs, pool=self.pool, output_dir=self.output_dir,
+                      fragments=self.fragments)
+
+    def font_names(self):
+        return sorted(set([Text('').style['font_family'], Note('').style['font_family']]))
+
+    def __iter__(self):
+        for key, variant_config in self.variants():
+            yield self.page(variant_config)
 
         return
 
     def load(self, name):
-        basename = os.path.basename(name)
-        name, suffix = os.path.splitext(basename)
+        name, suffix = os.path.splitext(name)
 
         path = '{}.json'.format(name)
         print('loading family config file: {}'.format(path))
@@ -205,12 +546,72 @@ class Pages:
 
 
 if __name__ == '__main__':
-    config_name = 'da.json'
+    parser = argparse.ArgumentParser(description='Build SVG pinout pages from family config files.')
+    parser.add_argument('configs', nargs='*', default=['da.json'], help='family config files, default da.json')
+    parser.add_argument('--only', action='append', metavar='GLOB',
+                        help='render only variants whose key matches, may be repeated')
+    parser.add_argument('--exclude', action='append', metavar='GLOB',
+                        help='skip variants whose key matches, may be repeated')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='list the planned pages, their inputs and cache status, then stop')
+    parser.add_argument('--output-dir', default='', metavar='DIR',
+                        help='save each family into DIR/<family>, named after its config file')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--batch', action='store_true',
+                      help='release each page as soon as it is saved and report peak rss per page')
+    mode.add_argument('--pipeline', type=int, nargs='?', const=3, metavar='PAGES',
+                      help='load and write pages while others are laid out, at most PAGES (3) in flight')
+    parser.add_argument('--stats', action='store_true',
+                        help='report hot path counters per page and for the whole run')
+    args = parser.parse_args()
+
+    if args.pipeline is not None and args.pipeline < 1:
+        parser.error('--pipeline needs at least 1 page in flight')
+
+    def output_dir(config_name):
+        if not args.output_dir:
+            return ''
+
+        family = os.path.basename(os.path.splitext(config_name)[0])
+        return os.path.join(args.output_dir, family)
+
+    if args.dry_run:
+        for config_name in args.configs:
+            pages = Pages(config_name, args.only, args.exclude, output_dir=output_dir(config_name))
+            print('\n'.join(pages.plan()))
+
+        exit()
+
+    stats.enabled = args.stats
+    report = StatsReport()
+
+    # fonts and resolved colors are cached process wide. parsed atdfs are shared
+    # between families too, except in batch mode where memory stays bounded.  the
+    # fragment cache is bounded, so families share it in every mode.
+    atdfs = None if args.batch else AtdfCache()
+    fragments = FragmentCache()
+
+    for config_name in args.configs:
+        pages = Pages(config_name, args.only, args.exclude, atdfs, output_dir(config_name), fragments)
+        if pages.output_dir:
+            os.makedirs(pages.output_dir, exist_ok=True)
+
+        exporter = Exporter(pages.page_config.get('export', {}))
+        if args.batch:
+            render_batch(pages, exporter, report)
+        elif args.pipeline is not None:
+            Pipeline(pages, exporter, report, args.pipeline).run()
+        else:
+            for page in pages:
+                filepath = page.save()
+                print('Saved to {}'.format(filepath))
+                report.page(filepath)
+
+                exporter.submit(filepath, page.as_svg())
+
+        exporter.close()
 
-    pages = Pages(config_name)
-    for page in pages:
-        filepath = page.save()
-        print('Saved to {}'.format(filepath))
+    report.batch()
 
     exit()
 
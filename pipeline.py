@@ -0,0 +1,129 @@
+# pipeline.py - rendering that overlaps loading and writing with page layout.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# while page N is laid out, the atdf of page N+1 is read and page N-1 is written
+# and exported.  the stages run in worker threads, so waits on the disk and the
+# network overlap layout.  parsing and layout are python and still share the gil.
+#
+#   load:   atdf parse, font download       one task per atdf, fonts once
+#   layout: classify, layout, serialize     one page at a time, in page order
+#   write:  svg file, export targets        one task per page
+
+import asyncio
+
+from text import GoogleFontCache
+
+
+class Pipeline():
+    def __init__(self, pages, exporter, report, in_flight=3):
+        """
+
+        Args:
+            pages (Pages): the pages to render, with an AtdfCache
+            exporter (Exporter): export targets for each saved page
+            report (StatsReport): counter report, printed once for all the pages
+            in_flight (int): most pages between the start of loading and the end of writing
+        """
+        self.pages = pages
+        self.exporter = exporter
+        self.report = report
+        self.in_flight = in_flight
+
+        if self.pages.atdfs is None:
+            # the load stage hands parsed atdfs to the layout stage through the cache
+            raise ValueError('pipeline rendering needs pages with an atdf cache')
+
+        self.loads = dict()  # atdf path -> load task
+        return
+
+    def run(self):
+        """
+        Returns:
+            filepaths (list): the saved svg files, in page order
+        """
+        return asyncio.run(self.render())
+
+    async def render(self):
+        slots = asyncio.Semaphore(self.in_flight)
+        queue = asyncio.Queue()
+
+        fonts = asyncio.create_task(asyncio.to_thread(self.fetch_fonts))
+        producer = asyncio.create_task(self.produce(queue, slots))
+
+        writes = []
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+
+                variant_config, loading = item
+                await asyncio.gather(loading, fonts)
+
+                page = await asyncio.to_thread(self.layout, variant_config)
+                writes.append(asyncio.create_task(self.write(page, slots)))
+
+            await producer
+        finally:
+            filepaths = await asyncio.gather(*writes)
+
+        # pages overlap, so the counters can not be split between them
+        self.report.page('{} ({} pages)'.format(self.pages.config_name, len(filepaths)))
+        return filepaths
+
+    async def produce(self, queue, slots):
+        # a page enters the pipeline only when a slot is free, which holds back loading
+        # while layout or writing is behind.
+        try:
+            for key, variant_config in self.pages.variants():
+                await slots.acquire()
+                await queue.put((variant_config, self.load(variant_config)))
+        finally:
+            await queue.put(None)
+
+        return
+
+    def load(self, variant_config):
+        path = self.pages.atdf_path(variant_config)
+        if path not in self.loads:
+            self.loads[path] = asyncio.create_task(asyncio.to_thread(self.pages.atdfs.load, path))
+
+        return self.loads[path]
+
+    def fetch_fonts(self):
+        for font_name in self.pages.font_names():
+            GoogleFontCache(dict(font_family=font_name))
+
+        return
+
+    def layout(self, variant_config):
+        page = self.pages.page(variant_config)
+        page.as_svg()
+
+        return page
+
+    async def write(self, page, slots):
+        try:
+            filepath = await asyncio.to_thread(page.save)
+            print('Saved to {}'.format(filepath))
+
+            self.exporter.submit(filepath, page.as_svg())
+        finally:
+            page.release()
+            slots.release()
+
+        return filepath
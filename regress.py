@@ -0,0 +1,300 @@
+# regress.py - Application. renders fixture pages and checks them against golden output and timing budgets.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# python regress.py            check every fixture, exit status 1 on any failure
+# python regress.py --update   accept the current output and timings as the new goldens
+#
+# Fixtures are the synthetic devices of fixtures/regress.json, plus the variants of
+# da.json when --bundled is given and its atdf files are present.  Fonts come from
+# fixtures/fonts (Roboto and Roboto Mono regular, Apache 2.0) unless --fonts names
+# another font cache; nothing is downloaded.  Text widths summed from
+# glyph advances are then checked against PIL's for every string on the pages.
+
+import os
+import re
+import json
+import time
+import argparse
+from types import SimpleNamespace
+from xml.etree import ElementTree
+
+from pinout import DxPage, AtdfCache, atdf_path
+from text import GoogleFont, GoogleFontCache
+
+
+home = os.path.dirname(os.path.abspath(__file__))
+fixtures_home = os.path.join(home, 'fixtures')
+fonts_home = os.path.join(fixtures_home, 'fonts')
+golden_home = os.path.join(fixtures_home, 'golden')
+budgets_path = os.path.join(golden_home, 'budgets.json')
+
+stages = ['parse', 'classify', 'layout', 'serialize']
+metric_sizes = [8, 12, 20, 25, 40]
+
+
+class FixtureAtdfs():
+    # loads synthetic devices from json, shaped like a microchip_dfp Atdf
+    def load(self, path):
+        with open(path, 'r') as fp:
+            fixture = json.load(fp)
+
+        instances = dict()
+        for function, group, index, pad in fixture['signals']:
+            name = function.partition('_')[0]
+            signal = SimpleNamespace(function=function, group=group, index=index, pad=pad)
+            instances.setdefault(name, SimpleNamespace(signals=[])).signals.append(signal)
+
+        module = SimpleNamespace(instances=instances)
+        device = SimpleNamespace(name=fixture['device'], architecture=fixture['architecture'], peripherals=[module])
+
+        pinout = [SimpleNamespace(pad=pad, position=str(position)) for position, pad in enumerate(fixture['pads'], 1)]
+        variant = SimpleNamespace(ordercode=fixture['device'], package=fixture['package'], pinout=fixture['package'])
+
+        return SimpleNamespace(devices=[device], variants=[variant], pinouts={fixture['package']: pinout})
+
+
+def calibrate():
+    # seconds taken by a fixed workload. budgets are multiples of it, so they hold across machines.
+    best = None
+    for i in range(5):
+        start = time.perf_counter()
+        total = 0
+        for value in range(200000):
+            total += value * value
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def normalize(svg):
+    """
+    Reduce an svg to its structure: element tree, attributes with numbers rounded to one
+    decimal and ids renumbered in document order.  Embedded font css is dropped.
+
+    Returns:
+        normalized (str): one line per element
+    """
+    ids = dict()
+
+    def rename(value):
+        return ids.setdefault(value, 'id{}'.format(len(ids)))
+
+    def number(match):
+        return '{:.1f}'.format(float(match.group()))
+
+    lines = []
+
+    def walk(element, depth):
+        tag = element.tag.rpartition('}')[2]
+
+        attributes = []
+        for key, value in sorted(element.attrib.items()):
+            key = key.rpartition('}')[2]
+            if key == 'id':
+                value = rename(value)
+            elif key == 'href' and value.startswith('#'):
+                value = '#' + rename(value[1:])
+            else:
+                value = re.sub(r'-?\d+\.\d+', number, value)
+
+            attributes.append('{}="{}"'.format(key, value))
+
+        text = '' if tag == 'style' else (element.text or '').strip()
+        lines.append('{}<{}> {}'.format('  ' * depth, ' '.join([tag] + attributes), text).rstrip())
+
+        for child in element:
+            walk(child, depth + 1)
+
+        return
+
+    walk(ElementTree.fromstring(svg), 0)
+    return '\n'.join(lines) + '\n'
+
+
+def svg_texts(svg):
+    texts = set()
+    for element in ElementTree.fromstring(svg).iter():
+        # the embedded font css is not drawn text, as in normalize()
+        if element.tag.rpartition('}')[2] == 'style':
+            continue
+
+        if element.text and element.text.strip():
+            texts.add(element.text.strip())
+
+    return texts
+
+
+def check_metrics(texts):
+    """
+    Measure every string with the summed glyph advances and with PIL, in every loaded font.
+
+    Returns:
+        failures (list): description of each string whose widths differ by more than
+            a pixel or 1%, whichever is larger
+    """
+    failures = []
+
+    if not GoogleFont.glyph_tables:
+        print('metrics  skipped, fontTools is not installed or raqm layout is measured by PIL')
+        return failures
+
+    count = 0
+    worst = 0
+    for font in GoogleFontCache():
+        for size in metric_sizes:
+            style = dict(font_family=font.style['font_family'], font_size=size)
+            measure = GoogleFont(style).measure
+            image_font = GoogleFont(style).image_font
+
+            for text in sorted(texts):
+                expected = image_font.getlength(text)
+                actual = measure.getlength(text)
+                error = abs(actual - expected)
+                worst = max(worst, error)
+                count += 1
+
+                if error > max(1, expected / 100):
+                    failures.append('{} {}: {!r} is {:.2f} wide, PIL says {:.2f}'.format(
+                        style['font_family'], size, text, actual, expected))
+
+    print('{:8} {}  {} widths, worst error {:.2f}px'.format('metrics', 'FAIL' if failures else 'ok', count, worst))
+    for failure in failures[:10]:
+        print('    {}'.format(failure))
+
+    return failures
+
+
+def fixtures(bundled):
+    """
+    Returns:
+        fixtures (list): (name, page config, variant config, atdfs)
+    """
+    found = []
+
+    with open(os.path.join(fixtures_home, 'regress.json'), 'r') as fp:
+        config = json.load(fp)
+
+    page_config = config.pop('page')
+    page_config['atdf_home'] = fixtures_home
+    for key, variant_config in config.items():
+        found.append((key, page_config, variant_config, FixtureAtdfs()))
+
+    if bundled:
+        with open(os.path.join(home, 'da.json'), 'r') as fp:
+            config = json.load(fp)
+
+        page_config = config.pop('page')
+        atdfs = AtdfCache()
+        for key, variant_config in config.items():
+            if os.path.exists(atdf_path(page_config, variant_config)):
+                found.append((key, page_config, variant_config, atdfs))
+            else:
+                print('{}: atdf not found, skipped'.format(key))
+
+    return found
+
+
+def check(name, page_config, variant_config, atdfs, budgets, calibration, update, texts):
+    """
+    Render one fixture and compare it with its golden output and timing budget.  The
+    strings drawn on the page are added to texts.
+
+    Returns:
+        failures (list): description of each failed check
+    """
+    failures = []
+
+    page = DxPage(page_config, variant_config, atdfs=atdfs)
+    normalized = normalize(page.as_svg())
+    texts.update(svg_texts(page.as_svg()))
+    timings = dict(page.timings)
+    page.release()
+
+    golden_path = os.path.join(golden_home, '{}.txt'.format(name))
+    if update:
+        os.makedirs(golden_home, exist_ok=True)
+        with open(golden_path, 'w') as fp:
+            fp.write(normalized)
+    elif not os.path.exists(golden_path):
+        failures.append('no golden output, run with --update')
+    else:
+        with open(golden_path, 'r') as fp:
+            golden = fp.read()
+
+        if golden != normalized:
+            for number, (expected, actual) in enumerate(zip(golden.splitlines(), normalized.splitlines()), 1):
+                if expected != actual:
+                    failures.append('output differs at line {}:\n    - {}\n    + {}'.format(number, expected.strip(), actual.strip()))
+                    break
+            else:
+                failures.append('output differs in length')
+
+    for stage in stages:
+        relative = timings[stage] / calibration
+        if update:
+            # leave room for noise between runs
+            budgets.setdefault(name, dict())[stage] = round(max(relative * 3, 1), 1)
+        elif stage not in budgets.get(name, dict()):
+            failures.append('no {} timing budget, run with --update'.format(stage))
+        elif relative > budgets[name][stage]:
+            failures.append('{} took {:.1f}x calibration, budget is {}x'.format(stage, relative, budgets[name][stage]))
+
+    print('{:8} {}  {}'.format(name, 'FAIL' if failures else 'ok',
+                               '  '.join('{} {:.1f}ms'.format(stage, timings[stage] * 1000) for stage in stages)))
+    for failure in failures:
+        print('    {}'.format(failure))
+
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check rendered fixtures against golden output and timing budgets.')
+    parser.add_argument('--update', action='store_true', help='write the current output and timings as goldens')
+    parser.add_argument('--bundled', action='store_true', help='also render the variants of da.json')
+    parser.add_argument('--fonts', default=fonts_home, help='local font cache directory, defaults to fixtures/fonts')
+    args = parser.parse_args()
+
+    # goldens are only comparable when rendered with the same font files
+    GoogleFontCache.cache_home = os.path.abspath(args.fonts)
+    GoogleFontCache.offline = True
+
+    budgets = dict()
+    if os.path.exists(budgets_path):
+        with open(budgets_path, 'r') as fp:
+            budgets = json.load(fp)
+
+    calibration = calibrate()
+    print('calibration {:.1f}ms'.format(calibration * 1000))
+
+    failed = 0
+    texts = set()
+    for name, page_config, variant_config, atdfs in fixtures(args.bundled):
+        if check(name, page_config, variant_config, atdfs, budgets, calibration, args.update, texts):
+            failed += 1
+
+    if check_metrics(texts):
+        failed += 1
+
+    if args.update:
+        with open(budgets_path, 'w') as fp:
+            json.dump(budgets, fp, indent=4, sort_keys=True)
+
+    print('{} failed'.format(failed))
+    exit(1 if failed else 0)
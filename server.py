@@ -0,0 +1,183 @@
+# server.py - Application. a local http service that renders pinout pages on demand.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# POST /render with a json body of
+#   {"variant": {...variant config...}, "page": {...optional page overrides...}}
+# or GET /render?variant=DA28 for a variant of the served config file.
+# Either returns the svg of the page.  page overrides are layered over the served
+# config's page section, so a request only sends the settings it changes.
+
+import json
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from pinout import Pages, DxPage, AtdfCache
+from page import FragmentCache
+from config import LayeredConfig
+
+
+class RenderCache():
+    def __init__(self, pages, size=64):
+        """
+        Renders pages and keeps the most recently used results.
+
+        Args:
+            pages (Pages): the served family config, supplies the default page config
+            size (int): number of rendered pages to keep
+        """
+        self.pages = pages
+        self.size = size
+
+        self.atdfs = AtdfCache()
+        self.fragments = FragmentCache()
+        self.rendered = OrderedDict()
+
+        self.cache_lock = threading.Lock()
+
+        return
+
+    def key(self, page_config, variant_config):
+        normalized = json.dumps([page_config, variant_config], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+    def get(self, key):
+        with self.cache_lock:
+            svg = self.rendered.get(key)
+            if svg is not None:
+                self.rendered.move_to_end(key)
+
+        return svg
+
+    def put(self, key, svg):
+        with self.cache_lock:
+            self.rendered[key] = svg
+            self.rendered.move_to_end(key)
+            while len(self.rendered) > self.size:
+                self.rendered.popitem(last=False)
+
+        return
+
+    def render(self, variant_config, page_overrides=None):
+        """
+        Args:
+            variant_config (dict): the variant to render
+            page_overrides (dict): page settings that replace those of the served config
+
+        Returns:
+            svg (str): the rendered page, from the cache when the same configs were rendered before
+        """
+        # the served page config never changes, so the overrides identify the page config
+        key = self.key(page_overrides, variant_config)
+        svg = self.get(key)
+        if svg is not None:
+            return svg
+
+        page_config = LayeredConfig(self.pages.page_config, page_overrides)
+        page = DxPage(page_config, variant_config, atdfs=self.atdfs, fragments=self.fragments)
+        svg = page.as_svg()
+        page.release()
+
+        self.put(key, svg)
+
+        return svg
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    cache = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/render':
+            self.send_error(404)
+            return
+
+        names = parse_qs(url.query).get('variant', [])
+        if len(names) != 1 or names[0] not in self.cache.pages.config or names[0].lower() == 'page':
+            self.send_error(400, 'expected ?variant= naming a variant of the served config')
+            return
+
+        self.render(self.cache.pages.config[names[0]])
+        return
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/render':
+            self.send_error(404)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            variant_config = request['variant']
+            page_overrides = request.get('page')
+            if not isinstance(variant_config, dict) or not isinstance(page_overrides, (dict, type(None))):
+                raise TypeError('variant and page must be json objects')
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.send_error(400, 'expected a json body with a variant config')
+            return
+
+        self.render(variant_config, page_overrides)
+        return
+
+    def render(self, variant_config, page_overrides=None):
+        # a bad config or a missing atdf is the client's to fix, anything else is ours
+        try:
+            svg = self.cache.render(variant_config, page_overrides)
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            self.send_error(400, 'can not render this config', repr(e))
+            return
+        except Exception as e:
+            self.send_error(500, 'render failed', repr(e))
+            return
+
+        self.reply(svg)
+        return
+
+    def reply(self, svg):
+        body = svg.encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/svg+xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        return
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve rendered pinout pages over http.')
+    parser.add_argument('config', nargs='?', default='da.json', help='family config file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8023)
+    parser.add_argument('--cache-size', type=int, default=64, help='number of rendered pages to keep')
+    args = parser.parse_args()
+
+    RenderHandler.cache = RenderCache(Pages(args.config), args.cache_size)
+
+    server = ThreadingHTTPServer((args.host, args.port), RenderHandler)
+    print('serving on http://{}:{}/render'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    server.server_close()
+    exit()
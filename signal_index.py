@@ -0,0 +1,253 @@
+# signal_index.py - Application. an sqlite index of every signal in a DFP.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sqlite3
+import argparse
+
+import microchip_dfp as Dfpack
+
+from signals import SignalPool
+
+
+schema = '''
+create table if not exists files (
+    id integer primary key,
+    path text unique not null,
+    mtime real not null,
+    size integer not null
+);
+create table if not exists devices (
+    id integer primary key,
+    file_id integer not null references files(id) on delete cascade,
+    name text not null,
+    architecture text
+);
+create table if not exists variants (
+    id integer primary key,
+    device_id integer not null references devices(id) on delete cascade,
+    ordercode text,
+    package text,
+    pinout text,
+    pin_count integer
+);
+create table if not exists positions (
+    device_id integer not null references devices(id) on delete cascade,
+    pinout text not null,
+    pad text not null,
+    position integer not null
+);
+create table if not exists signals (
+    device_id integer not null references devices(id) on delete cascade,
+    instance text,
+    function text not null,
+    "group" text,
+    "index" text,
+    pad text not null,
+    type text,
+    text text
+);
+create index if not exists devices_file on devices(file_id);
+create index if not exists variants_device on variants(device_id);
+create index if not exists variants_pin_count on variants(pin_count);
+create index if not exists positions_device_pad on positions(device_id, pinout, pad);
+create index if not exists signals_device on signals(device_id);
+create index if not exists signals_function on signals(function);
+create index if not exists signals_pad on signals(pad);
+create index if not exists signals_type on signals(type);
+'''
+
+
+class SignalIndex():
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (str): sqlite database file, created if missing
+        """
+        self.db = sqlite3.connect(db_path)
+        self.db.execute('pragma foreign_keys = on')
+        self.db.executescript(schema)
+
+        self.types = dict()  # function class -> title
+        self.pool = SignalPool()
+        return
+
+    def close(self):
+        self.db.close()
+        return
+
+    def update(self, atdf_home):
+        """
+        Index every atdf in a directory.  Files unchanged since the last update are skipped
+        and files no longer present are dropped.
+
+        Args:
+            atdf_home (str): directory of atdf files
+
+        Returns:
+            count (int): number of files (re)indexed
+        """
+        atdf_home = os.path.expanduser(atdf_home)
+
+        known = dict()
+        for id, path, mtime, size in self.db.execute('select id, path, mtime, size from files'):
+            known[path] = (id, mtime, size)
+
+        count = 0
+        present = set()
+        for name in sorted(os.listdir(atdf_home)):
+            if not name.endswith('.atdf'):
+                continue
+
+            path = os.path.abspath(os.path.join(atdf_home, name))
+            present.add(path)
+
+            stat = os.stat(path)
+            if path in known and known[path][1:] == (stat.st_mtime, stat.st_size):
+                continue
+
+            with self.db:
+                if path in known:
+                    self.db.execute('delete from files where id = ?', (known[path][0],))
+
+                self.index_file(path, stat)
+
+            print('indexed {}'.format(name))
+            count += 1
+
+        home = os.path.abspath(atdf_home)
+        with self.db:
+            for path in known:
+                # only files of this directory, not of one that shares its name as a prefix
+                if os.path.dirname(path) == home and path not in present:
+                    self.db.execute('delete from files where id = ?', (known[path][0],))
+                    print('dropped {}'.format(os.path.basename(path)))
+
+        return count
+
+    def index_file(self, path, stat):
+        atdf = Dfpack.Atdf(path)
+
+        cursor = self.db.execute('insert into files (path, mtime, size) values (?, ?, ?)',
+                                 (path, stat.st_mtime, stat.st_size))
+        file_id = cursor.lastrowid
+
+        device = atdf.devices[0]
+        cursor = self.db.execute('insert into devices (file_id, name, architecture) values (?, ?, ?)',
+                                 (file_id, device.name, device.architecture))
+        device_id = cursor.lastrowid
+
+        pin_counts = dict()
+        for pinout_name in set(variant.pinout for variant in atdf.variants):
+            rows = [(device_id, pinout_name, mapping.pad, int(mapping.position)) for mapping in atdf.pinouts[pinout_name]]
+            self.db.executemany('insert into positions values (?, ?, ?, ?)', rows)
+            pin_counts[pinout_name] = len(rows)
+
+        for variant in atdf.variants:
+            self.db.execute('insert into variants (device_id, ordercode, package, pinout, pin_count) values (?, ?, ?, ?, ?)',
+                            (device_id, variant.ordercode, variant.package, variant.pinout, pin_counts[variant.pinout]))
+
+        rows = []
+        for module in device.peripherals:
+            for name, instance in module.instances.items():
+                if not instance.signals:
+                    continue
+
+                for signal in instance.signals:
+                    record = self.pool.record(signal)
+                    rows.append((device_id, name, record.function, record.group, str(record.index),
+                                 record.pad, self.type(record), record.text))
+
+        self.db.executemany('insert into signals values (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return
+
+    def type(self, record):
+        if record.cls not in self.types:
+            self.types[record.cls] = record.cls(signal=record).title
+
+        return self.types[record.cls]
+
+    def query(self, function=None, pad=None, pins=None, type=None, group=None):
+        """
+        Find the signals matching every given filter.  Text filters are case insensitive
+        and function matches by prefix, so 'TCD0' also finds 'TCD0_ALT1'.
+
+        Returns:
+            rows (list): (device, ordercode, package, pad, position, function, text)
+        """
+        sql = '''
+            select distinct d.name, v.ordercode, v.package, s.pad, p.position, s.function, s.text
+            from signals s
+            join devices d on d.id = s.device_id
+            join variants v on v.device_id = s.device_id
+            join positions p on p.device_id = s.device_id and p.pinout = v.pinout and p.pad = s.pad
+        '''
+
+        where = []
+        params = []
+        if function is not None:
+            where.append('s.function like ?')
+            params.append(function + '%')
+        if pad is not None:
+            where.append('s.pad = ? collate nocase')
+            params.append(pad)
+        if pins is not None:
+            where.append('v.pin_count = ?')
+            params.append(pins)
+        if type is not None:
+            where.append('s.type = ? collate nocase')
+            params.append(type)
+        if group is not None:
+            where.append('s."group" like ?')
+            params.append('%' + group + '%')
+
+        if where:
+            sql += ' where ' + ' and '.join(where)
+
+        sql += ' order by d.name, v.ordercode, p.position'
+
+        return self.db.execute(sql, params).fetchall()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index and query the signals of every device in a DFP.')
+    parser.add_argument('--db', default='dx_signals.sqlite', help='index database file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update = commands.add_parser('update', help='index new or changed atdf files')
+    update.add_argument('atdf_home', help='atdf directory of a DFP')
+
+    query = commands.add_parser('query', help='list the signals matching every filter')
+    query.add_argument('--function', help='atdf function prefix such as TCD0 or USART1')
+    query.add_argument('--pad', help='pad name such as PA4')
+    query.add_argument('--pins', type=int, help='package pin count')
+    query.add_argument('--type', help='function type such as PWM, OpAmp, USART')
+    query.add_argument('--group', help='signal group substring such as OUT or WOA')
+
+    args = parser.parse_args()
+
+    index = SignalIndex(args.db)
+    if args.command == 'update':
+        count = index.update(args.atdf_home)
+        print('{} files indexed'.format(count))
+    else:
+        rows = index.query(args.function, args.pad, args.pins, args.type, args.group)
+        for row in rows:
+            print('{:14} {:22} {:10} {:5} {:>3}  {:12} {}'.format(*[str(value) for value in row]))
+
+    index.close()
+    exit()
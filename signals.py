@@ -0,0 +1,122 @@
+# signals.py - shared, immutable signal records.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+
+from dx_functions import SignalFunctionFactory
+
+
+def intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+
+    return value
+
+
+class SignalRecord():
+    """
+    Immutable stand-in for an atdf signal and its classification.
+
+    Duck types the atdf signal (function, group, index, pad) so a record can be
+    handed straight to SignalFunctionFactory or a DxSignalFunction subclass.  The
+    label's text, parsed name, instance and alternate position and its sort key are
+    kept too, and labels built from the record take them instead of parsing again.
+    """
+    __slots__ = ('function', 'group', 'index', 'pad', 'cls', 'text', 'raw_value', 'parsed', 'sort_key')
+
+    def __init__(self, signal, cls=None):
+        """
+
+        Args:
+            signal: atdf signal
+            cls: the signal's DxSignalFunction class when already classified
+        """
+        assign = super().__setattr__
+        assign('function', intern(signal.function))
+        assign('group', intern(signal.group))
+        assign('index', intern(signal.index))
+        assign('pad', intern(signal.pad))
+
+        if cls is None:
+            cls = SignalFunctionFactory.classify(self.function)
+
+        assign('cls', cls)
+
+        # made once per distinct signal, then seeded into every page's label of it
+        label = self.cls(signal=self)
+        assign('text', intern(label.text))
+        assign('raw_value', intern(label.raw_value))
+        assign('parsed', (intern(label.name), label.instance, label.alt_position))
+        assign('sort_key', label.sort_key)
+        return
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SignalRecord is immutable')
+
+    @property
+    def key(self):
+        return self.function, self.group, self.index, self.pad
+
+    def __eq__(self, other):
+        return isinstance(other, SignalRecord) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return 'SignalRecord({}, {}, {}, {})'.format(*self.key)
+
+
+class SignalPool():
+    def __init__(self):
+        """
+        Family wide pool of signal records.  Devices of a family share nearly all of their
+        signals, so each distinct (function, group, index, pad) is classified, labeled and
+        stored once and every device's pinmap references the pooled record.
+        """
+        self.records = dict()  # (function, group, index, pad) -> SignalRecord
+        self.classes = dict()  # function -> DxSignalFunction class
+
+        return
+
+    def __len__(self):
+        return len(self.records)
+
+    def classify(self, function):
+        cls = self.classes.get(function)
+        if cls is None:
+            cls = SignalFunctionFactory.classify(function)
+            self.classes[intern(function)] = cls
+
+        return cls
+
+    def record(self, signal):
+        """
+        Args:
+            signal: atdf signal or SignalRecord
+
+        Returns:
+            SignalRecord: the pooled record of the signal
+        """
+        key = (signal.function, signal.group, signal.index, signal.pad)
+
+        record = self.records.get(key)
+        if record is None:
+            record = SignalRecord(signal, self.classify(signal.function))
+            self.records[record.key] = record
+
+        return record
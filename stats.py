@@ -0,0 +1,77 @@
+# stats.py - hot path counters, reported per page and per batch with --stats.
+#
+# Copyright (c) 2023 Coburn Wightman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# callers guard each count with the enabled flag, so disabled counters cost one
+# attribute lookup:
+#     if stats.enabled:
+#         stats.count('getlength')
+
+from collections import Counter
+
+enabled = False
+counts = Counter()
+
+names = ['getlength', 'truetype', 'get_colors', 'parse_function', 'http_requests', 'http_bytes',
+         'footnote_tests', 'svg_elements', 'fragments']
+
+
+def count(name, n=1):
+    counts[name] += n
+    return
+
+
+def count_elements(element):
+    # a drawsvg element and all of its children
+    total = 1
+    for child in getattr(element, 'children', []):
+        total += count_elements(child)
+
+    return total
+
+
+class StatsReport():
+    def __init__(self):
+        """
+        Prints the counters gathered since the previous page, and the batch total.
+        """
+        self.start = Counter(counts)
+        self.mark = Counter(counts)
+        return
+
+    def format(self, counters):
+        return '  '.join('{} {}'.format(name, counters[name]) for name in names)
+
+    def page(self, name):
+        if not enabled:
+            return
+
+        current = Counter(counts)
+        current.subtract(self.mark)
+        self.mark = Counter(counts)
+
+        print('  stats {}: {}'.format(name, self.format(current)))
+        return
+
+    def batch(self):
+        if not enabled:
+            return
+
+        total = Counter(counts)
+        total.subtract(self.start)
+
+        print('stats batch: {}'.format(self.format(total)))
+        return
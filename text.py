@@ -15,38 +15,46 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
+import mmap
+import threading
+
 import requests
-from io import BytesIO
 from PIL import ImageFont
 
 import drawsvg as dw
 import pinoutOverview as Overview
 
+from metrics import TTFont, GlyphMetrics, SizedMetrics, layout_engine
+import stats
+
 
 class GoogleFontCache():
+    # fonts are downloaded once into cache_home and mapped read-only from there, so
+    # threads and worker processes share one copy of each font's bytes.
+    cache_home = os.path.expanduser(os.environ.get('DX_PINOUTS_FONT_CACHE', '~/.cache/dx-pinouts/fonts'))
+    # when set, only fonts already in cache_home are used
+    offline = False
+
     __font_cache = dict()
+    __lock = threading.Lock()
+    __loading = dict()  # font name -> lock held while that font loads
 
     def __init__(self, font_style=None):
         self._font_style = font_style
         self._font = None
 
         if self._font_style is not None:
-            font_name = self._font_style['font_family']
-            try:
-                self._font = self._font_cache[font_name]
-            except KeyError:
-                font_face = self._download_google_font_face(font_name)
-                font_data = self._download_google_font_data(font_face)
-                font = dict(face=font_face, data=font_data)
-
-                self._font_cache[font_name] = font
-                self._font = font
+            self._font = self._load(self._font_style['font_family'])
 
         return
 
     def __iter__(self):
         font_style = dict()
-        for font_name in self._get_font_cache():
+        with self.__lock:
+            font_names = list(self._get_font_cache())
+
+        for font_name in font_names:
             font_style['font_family'] = font_name
             yield GoogleFont(font_style)
 
@@ -58,8 +66,13 @@ class GoogleFontCache():
 
     @property
     def font_data(self):
+        # a read-only mmap of the font file
         return self._font['data']
 
+    @property
+    def font_path(self):
+        return self._font['path']
+
     @property
     def _font_cache(self):
         return self._get_font_cache()
@@ -68,11 +81,101 @@ class GoogleFontCache():
     def _get_font_cache(cls):
         return cls.__font_cache
 
+    def _load(self, font_name):
+        font = self._font_cache.get(font_name)
+        if font is not None:
+            return font
+
+        # single flight: the first thread loads, later threads wait for it.
+        with self.__lock:
+            font_lock = self.__loading.setdefault(font_name, threading.Lock())
+
+        with font_lock:
+            font = self._font_cache.get(font_name)
+            if font is None:
+                font = self._read_font_file(font_name)
+
+            if font is None and self.offline:
+                raise RuntimeError('font {} is not in {} and downloads are disabled'.format(font_name, self.cache_home))
+
+            if font is None:
+                font_face = self._download_google_font_face(font_name)
+                font_data = self._download_google_font_data(font_face)
+                self._write_font_file(font_name, font_face, font_data)
+
+                font = self._read_font_file(font_name)
+
+            self._font_cache[font_name] = font
+
+        return font
+
+    def is_cached(self, font_name):
+        # loaded, or on disk from an earlier run
+        if font_name in self._font_cache:
+            return True
+
+        return os.path.exists(self._font_path(font_name, 'ttf')) and os.path.exists(self._font_path(font_name, 'css'))
+
+    def _font_path(self, font_name, suffix):
+        return os.path.join(self.cache_home, '{}.{}'.format(font_name.replace(' ', '_'), suffix))
+
+    def _read_font_file(self, font_name):
+        face_path = self._font_path(font_name, 'css')
+        data_path = self._font_path(font_name, 'ttf')
+
+        try:
+            with open(face_path, 'r', encoding='utf-8') as fp:
+                font_face = fp.read()
+
+            with open(data_path, 'rb') as fp:
+                font_data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # missing, or empty and so not mappable
+            return None
+
+        return dict(face=font_face, data=font_data, path=data_path)
+
+    def _write_font_file(self, font_name, font_face, font_data):
+        # write then rename, so other processes never map a partial file. the css goes
+        # last, since is_cached() and later runs only trust a font with both files.
+        self._check_font(font_name, font_face, font_data)
+        os.makedirs(self.cache_home, exist_ok=True)
+
+        for suffix, content in [('ttf', font_data), ('css', font_face.encode('utf-8'))]:
+            path = self._font_path(font_name, suffix)
+            temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+            try:
+                with open(temp_path, 'wb') as fp:
+                    fp.write(content)
+
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        return
+
+    font_signatures = (b'\x00\x01\x00\x00', b'true', b'OTTO')
+
+    def _check_font(self, font_name, font_face, font_data):
+        # an error page, a captive portal or a truncated body must never reach the cache
+        if '@font-face' not in font_face or 'url(' not in font_face:
+            raise ValueError('font {}: the downloaded css is not a font face'.format(font_name))
+
+        if len(font_data) < 12 or not font_data.startswith(self.font_signatures):
+            raise ValueError('font {}: the downloaded data is not a truetype font'.format(font_name))
+
+        return
+
     def _download_google_font_face(self, family_name):  # , kwargs=dict()
         google_url = "https://fonts.googleapis.com/css2"
         # kwargs.update(dict(family=family_name))
         kwargs = dict(family=family_name)
-        req = requests.get(google_url, params=kwargs)
+        req = requests.get(google_url, params=kwargs, timeout=30)
+        req.raise_for_status()
+        if stats.enabled:
+            stats.count('http_requests')
+            stats.count('http_bytes', len(req.content))
 
         print('downloading {}'.format(req.url))
         return req.text
@@ -84,14 +187,53 @@ class GoogleFontCache():
         end = line.find(')')
         font_url = line[:end]
 
-        req = requests.get(font_url)
+        req = requests.get(font_url, timeout=30)
+        req.raise_for_status()
         font_data = req.content
+        if stats.enabled:
+            stats.count('http_requests')
+            stats.count('http_bytes', len(font_data))
 
         #print('downloaded {}'.format(req.url))
         return font_data
 
 
+def measure_texts(texts, font_style):
+    """
+    Measure many strings with a single font load.
+
+    Args:
+        texts (iterable): strings to measure. duplicates are measured once.
+        font_style (dict): font style including font_family and font_size attributes.
+
+    Returns:
+        lengths (dict): string -> length in pixels
+    """
+    font = GoogleFont(font_style).measure
+
+    lengths = dict()
+    for text in texts:
+        if text not in lengths:
+            lengths[text] = font.getlength(text)
+            if stats.enabled:
+                stats.count('getlength')
+
+    return lengths
+
+
 class GoogleFont():
+    # ImageFonts by (font path, size) and embeddable css by font path. both built from the
+    # font file mapped by GoogleFontCache, so no consumer holds its own copy of the bytes.
+    __image_fonts = dict()
+    __css_fonts = dict()
+
+    # text widths summed from glyph advances, by font path and by (font path, size). set
+    # glyph_tables False to measure every string with PIL.  raqm layout is always
+    # measured by PIL, the sums are only exact for basic layout.
+    glyph_tables = TTFont is not None and layout_engine()
+    __glyph_metrics = dict()
+    __sized_metrics = dict()
+
     def __init__(self, font_style):
         """
 
@@ -101,7 +243,6 @@ class GoogleFont():
         self.style = font_style
         self._cache = GoogleFontCache(font_style)
 
-        self._font_data_stream = None
         return
 
     @property
@@ -117,25 +258,65 @@ class GoogleFont():
         return self._cache.font_data
 
     @property
-    def font_data_stream(self):
-        if self._font_data_stream is None:
-            self._font_data_stream = BytesIO(self.font_data)
-
-        self._font_data_stream.seek(0)
-        return self._font_data_stream
+    def font_path(self):
+        return self._cache.font_path
 
     @property
     def image_font(self):
-        return ImageFont.truetype(self.font_data_stream, self.font_size)
+        key = (self.font_path, self.font_size)
+
+        image_font = self.__image_fonts.get(key)
+        if image_font is None:
+            # freetype opens and maps the file itself
+            image_font = ImageFont.truetype(self.font_path, self.font_size)
+            if stats.enabled:
+                stats.count('truetype')
+            self.__image_fonts[key] = image_font
+
+        return image_font
+
+    @property
+    def glyph_metrics(self):
+        # None when the font's cmap can not be read
+        if self.font_path not in self.__glyph_metrics:
+            try:
+                metrics = GlyphMetrics(self.font_path)
+            except Exception as e:
+                print('glyph tables of {} not read, measuring with PIL: {}'.format(self.font_path, e))
+                metrics = None
+
+            self.__glyph_metrics[self.font_path] = metrics
+
+        return self.__glyph_metrics[self.font_path]
+
+    @property
+    def measure(self):
+        # an object with getlength(text): the summed glyph advances, or the ImageFont
+        if not self.glyph_tables or self.glyph_metrics is None:
+            return self.image_font
+
+        key = (self.font_path, self.font_size)
+
+        measure = self.__sized_metrics.get(key)
+        if measure is None:
+            image_font = GoogleFont(dict(self.style))
+            measure = SizedMetrics(self.glyph_metrics, self.font_size, lambda: image_font.image_font)
+            self.__sized_metrics[key] = measure
+
+        return measure
 
     @property
     def css_font(self):
-        prefix, url_open, suffix = self.font_face.partition('url(')
-        junk, url_close, suffix = suffix.partition(')')
+        loaded = self.__css_fonts.get(self.font_path)
+        if loaded is None:
+            prefix, url_open, suffix = self.font_face.partition('url(')
+            junk, url_close, suffix = suffix.partition(')')
 
-        mime = 'application/octet-stream'
-        encoded_data = dw.url_encode.bytes_as_data_uri(self.font_data, strip_chars='', mime=mime)
-        loaded = prefix + url_open + encoded_data + url_close + suffix
+            mime = 'application/octet-stream'
+            encoded_data = dw.url_encode.bytes_as_data_uri(self.font_data, strip_chars='', mime=mime)
+            loaded = prefix + url_open + encoded_data + url_close + suffix
+
+            self.__css_fonts[self.font_path] = loaded
 
         return loaded
 
@@ -167,8 +348,10 @@ class Text:
     @property
     def width(self):
         if self.font is not None:
-            # use ImageFont length calculation for 'high precision'
-            length = self.font.image_font.getlength(self.value)
+            # use glyph table or ImageFont length calculation for 'high precision'
+            length = self.font.measure.getlength(self.value)
+            if stats.enabled:
+                stats.count('getlength')
         else:
             # else return a rough approximation
             length = self.style['font_size'] * len(self.value)
@@ -198,6 +381,10 @@ class Text:
 
 
 class TextBlock(Overview.Region):
+    # word lengths at reference_size, per font. shared by every block and fit iteration.
+    reference_size = 100
+    __word_lengths = dict()
+
     def __init__(self, text, id=None, width=0, height=0):
         super().__init__(width, height)
 
@@ -220,18 +407,108 @@ class TextBlock(Overview.Region):
 
     @property
     def font(self):
-        return self.cache.image_font
+        return self.cache.measure
 
     @property
     def font_size(self):
         return self.cache.font_size
 
+    @property
+    def strings(self):
+        # the strings generate() will wrap
+        return self.text
+
+    def word_lengths(self):
+        style = dict(self.style)
+        style['font_size'] = self.reference_size
+
+        key = (style['font_family'], style['font_weight'])
+        if key not in self.__word_lengths:
+            self.__word_lengths[key] = dict()
+
+        lengths = self.__word_lengths[key]
+        words = [word.strip() for string in self.strings for word in string.split(' ')]
+        missing = [word for word in words + [' '] if word not in lengths]
+        if missing:
+            lengths.update(measure_texts(missing, style))
+
+        return lengths
+
+    def estimate_height(self, lengths, font_size, width):
+        # wrap_string() with word lengths scaled from the reference size
+        scale = font_size / self.reference_size
+        space = lengths[' '] * scale
+
+        height = 0
+        for string in self.strings:
+            line_count = 1
+            line_length = 0
+            for word in string.split(' '):
+                word_length = lengths[word.strip()] * scale
+                if (line_length + word_length) < width:
+                    line_length += word_length + space
+                else:
+                    line_count += 1
+                    line_length = word_length + space
+
+            height += line_count * font_size + font_size / 2
+
+        return height - font_size
+
+    def exact_height(self, width):
+        height = 0
+        for string in self.strings:
+            lines, string_height = self.wrap_string(string, width)
+            height += string_height
+
+        return height - self.font_size
+
+    def fit(self, width, height, min=8, max=None):
+        """
+        Set the largest font size at which the block fits within width and height.
+
+        Args:
+            width (float): available width
+            height (float): available height
+            min (int): smallest font size allowed
+            max (int): largest font size allowed, defaults to the current font size
+
+        Returns:
+            font_size (int): the chosen font size
+        """
+        if max is None:
+            max = self.style['font_size']
+
+        lengths = self.word_lengths()
+
+        low = min
+        high = max
+        while low < high:
+            size = (low + high + 1) // 2
+            if self.estimate_height(lengths, size, width) <= height:
+                low = size
+            else:
+                high = size - 1
+
+        # scaled lengths are close but not exact, confirm with the real font.
+        self.style['font_size'] = low
+        self.cache = GoogleFont(self.style)
+        while low > min and self.exact_height(width) > height:
+            low -= 1
+            self.style['font_size'] = low
+            self.cache = GoogleFont(self.style)
+
+        return low
+
     def wrap_string(self, string, width):
         words = string.split(' ')
 
         lines = []
         line = ''
         line_length = self.font.getlength(line)
+        if stats.enabled:
+            stats.count('getlength')
+
         for word in words:
             word = word.strip()
             word_length = self.font.getlength(word)
@@ -242,25 +519,50 @@ class TextBlock(Overview.Region):
                 line = word + ' '
 
             line_length = self.font.getlength(line)
+            if stats.enabled:
+                stats.count('getlength', 2)
 
         lines.append(line)
         height = len(lines) * self.font_size + self.font_size / 2
 
         return lines, height
 
-    def generate(self, width):
+    def wrap(self, width):
+        """
+        Wrap every string to width at the current font size, what generate() draws.
+
+        Returns:
+            wrapped (list): (lines, height) of each string
+        """
+        self.cache = GoogleFont(self.style)
+
+        wrapped = []
+        for string in self.strings:
+            wrapped.append(self.wrap_string(string, width))
+
+        return wrapped
+
+    def generate(self, width, wrapped=None):
+        """
+        Args:
+            width (float): available width
+            wrapped (list): the result of wrap(width) at the current font size, or None
+        """
         self.width = width
         self.cache = GoogleFont(self.style)
 
+        if wrapped is None:
+            wrapped = self.wrap(width)
+
         style = dict(self.style)
         if 'font_size' in style:
             del style['font_size']
 
         x = 0
         y = 0
-        for string in self.text:
-            lines, height = self.wrap_string(string, self.width)
-            self.append(dw.Text(lines, self.font_size, x=x, y=y, **style))
+        for lines, height in wrapped:
+            # Region.append, Footnotes.append takes footnote configs
+            super().append(dw.Text(lines, self.font_size, x=x, y=y, **style))
             y += height
 
         self.height = y - self.font_size